@@ -0,0 +1,393 @@
+# benchmark.py
+# Offline benchmark for the update pipeline: a local stand-in for the gtacnr.net / FiveM endpoints,
+# a fake guild and status channel, and a report of cycle latency, stage times, allocations and REST calls.
+#
+# Usage: python benchmark.py --players 2000 --members 5000 --cycles 10
+import argparse, asyncio, importlib.util, logging, os, random, statistics, string, sys, tempfile, time, tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from aiohttp import web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# main.py does "from config import *"; fall back to the example config if there is no config.py
+try:
+    import config
+except ImportError:
+    spec = importlib.util.spec_from_file_location("config", os.path.join(HERE, "config-example.py"))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    sys.modules["config"] = config
+
+import main
+
+
+def random_name(rng):
+    return "".join(rng.choice(string.ascii_letters + string.digits + "_") for _ in range(rng.randint(4, 14)))
+
+
+def noisy_name(rng, name):
+    # Small differences between in-game and Discord names, see --name-noise
+    return rng.choice([
+        lambda n: f"[{rng.choice(['ABC', 'LSPD', 'XX'])}] {n}",
+        lambda n: n.replace("o", "0").replace("e", "3"),
+        lambda n: f"{n}_",
+        lambda n: n.replace("a", "а"),  # Cyrillic a
+    ])(name)
+
+
+# --- Fake Discord objects ---
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+
+class FakeMember:
+    def __init__(self, guild, member_id, display_name, role_ids):
+        self.guild = guild
+        self.id = member_id
+        self.display_name = display_name
+        self.roles = [FakeRole(r) for r in role_ids]
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.members = []
+
+    def get_member(self, member_id):
+        return next((m for m in self.members if m.id == member_id), None)
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        await self.channel.rest_call("edit")
+        return self
+
+    async def delete(self):
+        await self.channel.rest_call("delete")
+
+
+class FakeChannel:
+    """
+    Stand-in for the status channel. Every method that would be a REST call is counted and can be delayed.
+    """
+    def __init__(self, channel_id, latency=0.0):
+        self.id = channel_id
+        self.latency = latency
+        self.rest_calls = Counter()
+        self.next_message_id = 1
+
+    async def rest_call(self, method):
+        self.rest_calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, **kwargs):
+        await self.rest_call("send")
+        self.next_message_id += 1
+        return FakeMessage(self, self.next_message_id)
+
+    async def fetch_message(self, message_id):
+        await self.rest_call("fetch")
+        return FakeMessage(self, message_id)
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+
+def build_fake_guild(args, rng):
+    """
+    Builds a guild with --members members. --swat-share of them are SWAT (ranked) and --trainee-share are
+    cadets/trainees; display names follow the --tag-patterns, e.g. "{name} [SWAT]".
+    """
+    guild = FakeGuild(main.GUILD_ID)
+    rank_roles = [r for r, rank in main.ROLE_TO_RANK.items() if rank not in ("Mentor", "Cadet", "Trainee")]
+    patterns = args.tag_patterns.split(",")
+    swat, trainees = [], []
+    for i in range(args.members):
+        name = random_name(rng)
+        roll = rng.random()
+        if roll < args.swat_share:
+            roles = [rng.choice(rank_roles), main.SWAT_ROLE_ID]
+            if rng.random() < 0.05:
+                roles.append(main.MENTOR_ROLE_ID)
+            swat.append(name)
+        elif roll < args.swat_share + args.trainee_share:
+            roles = [rng.choice([main.CADET_ROLE_ID, main.TRAINEE_ROLE_ID])]
+            trainees.append(name)
+        else:
+            roles = []
+        display_name = rng.choice(patterns).format(name=name)
+        guild.members.append(FakeMember(guild, 10_000 + i, display_name, roles))
+    return guild, swat, trainees
+
+
+# --- Synthetic API server ---
+class SyntheticApi:
+    """
+    Serves the players, servers and FiveM info.json/dynamic.json endpoints with configurable size, latency and failures.
+    Each region's roster changes by --churn of its players per request.
+    """
+    def __init__(self, args, rng, swat, trainees):
+        self.args = args
+        self.rng = rng
+        self.requests = Counter()
+        self.rosters = {}
+        for region in main.API_URLS:
+            roster = [random_name(rng) for _ in range(args.players)]
+            for i in range(min(len(roster), args.swat_online)):
+                roster[i] = f"[SWAT] {rng.choice(swat)}" if swat and i % 2 == 0 else rng.choice(trainees or swat or roster)
+                if rng.random() < args.name_noise:
+                    roster[i] = noisy_name(rng, roster[i])
+            self.rosters[region] = roster
+        self.resources = [f"resource_{i}" for i in range(args.fivem_resources)]
+        self.alerts = []
+
+    async def delay_or_fail(self, kind):
+        self.requests[kind] += 1
+        latency = max(0.0, self.rng.gauss(self.args.latency, self.args.latency / 4))
+        await asyncio.sleep(latency)
+        return self.rng.random() < self.args.failure_rate
+
+    def churn(self, roster):
+        for _ in range(int(len(roster) * self.args.churn)):
+            roster[self.rng.randrange(len(roster))] = random_name(self.rng)
+
+    async def players(self, request):
+        if await self.delay_or_fail("players"):
+            return web.Response(status=503)
+        roster = self.rosters.get(request.query.get("serverId"), [])
+        self.churn(roster)
+        return web.json_response([{"Username": {"Username": name}, "Uid": i} for i, name in enumerate(roster)])
+
+    async def servers(self, request):
+        if await self.delay_or_fail("servers"):
+            return web.Response(status=503)
+        now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        return web.json_response([
+            {
+                "Id": region,
+                "Players": len(roster),
+                "MaxPlayers": 2048,
+                "QueuedPlayers": self.rng.randint(0, 50),
+                "LastHeartbeatDateTime": now,
+            }
+            for region, roster in self.rosters.items()
+        ])
+
+    async def fivem_info(self, request):
+        if await self.delay_or_fail("fivem"):
+            return web.Response(status=503)
+        return web.json_response({"vars": {"Time": "Monday 12:30"}, "resources": self.resources})
+
+    async def fivem_dynamic(self, request):
+        if await self.delay_or_fail("fivem_probe"):
+            return web.Response(status=503)
+        return web.json_response({"clients": 2000, "gametype": "CnR", "mapname": "Los Santos", "sv_maxclients": 2048})
+
+    async def telegram(self, request):
+        # Stand-in for the Telegram Bot API, answering --alert-rate-limit of the requests with 429
+        self.requests["telegram"] += 1
+        if self.rng.random() < self.args.alert_rate_limit:
+            return web.json_response({"ok": False, "parameters": {"retry_after": 0.05}}, status=429)
+        self.alerts.append((await request.json())["text"])
+        return web.json_response({"ok": True})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/cnr/players", self.players)
+        app.router.add_get("/cnr/servers", self.servers)
+        app.router.add_get("/fivem/{region}/info.json", self.fivem_info)
+        app.router.add_get("/fivem/{region}/dynamic.json", self.fivem_dynamic)
+        app.router.add_post("/telegram/bot{token}/sendMessage", self.telegram)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def point_main_at(base_url, channels, guild, args):
+    # The URL dicts are shared with the config module, so they are updated in place
+    for region in main.API_URLS:
+        main.API_URLS[region] = f"{base_url}/cnr/players?serverId={region}"
+    for region in main.API_URLS_FIVEM:
+        main.API_URLS_FIVEM[region] = f"{base_url}/fivem/{region}/info.json"
+    main.API_URL_SERVERS = f"{base_url}/cnr/servers"
+    if not args.keep_rate_limit:
+        main.RATE_LIMIT_OVERRIDES[urlsplit(base_url).netloc] = (10_000, 10_000)
+    main.client.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+    by_id = {channel.id: channel for channel in channels}
+    main.client.get_channel = by_id.get
+    main.client.get_emoji = lambda emoji_id: None
+    main.client.get_partial_messageable = lambda channel_id: by_id[channel_id]
+    main.STATUS_TARGETS = list(by_id)
+    main.EMBEDS_FILE = os.path.join(tempfile.mkdtemp(prefix="swat-bench-"), "embeds.json")
+    main.SNAPSHOT_FILE = os.path.join(os.path.dirname(main.EMBEDS_FILE), "snapshot.json.gz")
+    main.SINGLE_MESSAGE_MODE = args.single_message
+    main.FUZZY_MATCHING = args.fuzzy
+    main.EXECUTION_MODE = args.execution_mode
+    main.TELEGRAM_ENABLED = True
+    main.TELEGRAM_API_BASE = f"{base_url}/telegram"
+    main.TELEGRAM_TOKEN_FILE = os.path.join(os.path.dirname(main.EMBEDS_FILE), "tgtoken.txt")
+    main.write_text_file(main.TELEGRAM_TOKEN_FILE, "benchmark")
+    main.ALERT_BATCH_DELAY = 0.05
+
+
+def stage_totals():
+    # stage -> (count, total seconds), summed over regions
+    totals = {}
+    for (name, labels), hist in main.metrics.histograms.items():
+        if name == "swat_stage_duration_seconds":
+            stage = dict(labels)["stage"]
+            count, total = totals.get(stage, (0, 0.0))
+            totals[stage] = (count + hist["count"], total + hist["sum"])
+    return totals
+
+
+def rest_calls(channels):
+    return sum((channel.rest_calls for channel in channels), Counter())
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    guild, swat, trainees = build_fake_guild(args, rng)
+    # One status channel per --targets, e.g. partner units in other guilds
+    channels = [FakeChannel(main.STATUS_CHANNEL_ID + i, latency=args.discord_latency) for i in range(args.targets)]
+    api = SyntheticApi(args, rng, swat, trainees)
+    base_url = await api.start()
+    point_main_at(base_url, channels, guild, args)
+    main.alert_dispatcher = main.AlertDispatcher()
+    main.alert_dispatcher.start()
+    if args.capture:
+        main.CAPTURE_ENABLED = True
+        main.CAPTURE_DIR = args.capture
+        main.start_capture_writer()
+
+    if not args.verbose:
+        main.log_console_handler.setLevel(logging.CRITICAL + 1)
+    start = time.perf_counter()
+    await main.update_discord_cache()
+    cache_build = time.perf_counter() - start
+
+    if args.trace_allocations:
+        tracemalloc.start()
+    latencies, peaks, stage_before = [], [], stage_totals()
+    for _ in range(args.cycles):
+        if args.trace_allocations:
+            tracemalloc.reset_peak()
+            current_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        await main.update_game_status()
+        latencies.append(time.perf_counter() - start)
+        if args.trace_allocations:
+            peaks.append(tracemalloc.get_traced_memory()[1] - current_before)
+    stage_after = stage_totals()
+    if args.trace_allocations:
+        tracemalloc.stop()
+
+    # Restart from the snapshot: cold caches, stored messages kept, time until every region is published
+    await main.save_snapshot()
+    main.region_state.clear()
+    main.discord_cache["timestamp"] = None
+    rest_before = sum(rest_calls(channels).values())
+    start = time.perf_counter()
+    await main.warm_start()
+    warm_start = time.perf_counter() - start
+    warm_start_calls = sum(rest_calls(channels).values()) - rest_before
+
+    # Send the collected errors the same way the bot does and let the dispatcher deliver them
+    await main.flush_error_buffer()
+    await main.alert_dispatcher.queue.join()
+    main.alert_dispatcher.stop()
+
+    await main.close_http_session()
+    main.shutdown_match_pool()
+    await api.stop()
+    if main.capture_writer is not None:
+        main.capture_writer.stop()
+
+    print(f"Guild: {args.members} members, {len(swat)} SWAT, {len(trainees)} cadets/trainees "
+          f"(cache build {cache_build * 1000:.1f} ms)")
+    print(f"Regions: {len(main.API_URLS)} x {args.players} players, latency {args.latency * 1000:.0f} ms, "
+          f"failure rate {args.failure_rate:.0%}, churn {args.churn:.0%}")
+    print()
+    print(f"Cycles: {args.cycles}")
+    print(f"  cycle latency  p50 {percentile(latencies, 50) * 1000:8.1f} ms   "
+          f"p95 {percentile(latencies, 95) * 1000:8.1f} ms   max {max(latencies) * 1000:8.1f} ms   "
+          f"mean {statistics.mean(latencies) * 1000:8.1f} ms")
+    if peaks:
+        print(f"  allocations    peak per cycle {max(peaks) / 1024:.0f} KiB, mean {statistics.mean(peaks) / 1024:.0f} KiB")
+    print()
+    print(f"  {'stage':<36}{'calls':>7}{'total ms':>11}{'per call ms':>13}")
+    for stage, (count, total) in sorted(stage_after.items()):
+        count -= stage_before.get(stage, (0, 0.0))[0]
+        total -= stage_before.get(stage, (0, 0.0))[1]
+        if count:
+            print(f"  {stage:<36}{count:>7}{total * 1000:>11.1f}{total / count * 1000:>13.3f}")
+    print()
+    print(f"  API requests:  {dict(api.requests)}")
+    calls = rest_calls(channels)
+    print(f"  REST calls:    {dict(calls)} ({sum(calls.values()) / args.cycles:.1f} per cycle, "
+          f"{len(channels)} channels)")
+    matches = Counter()
+    for (name, labels), value in main.metrics.counters.items():
+        if name == "swat_match_total":
+            labels = dict(labels)
+            matches[f"{labels['kind']}/{labels['method']}"] += int(value)
+    print(f"  Matches:       {dict(sorted(matches.items()))}")
+    print(f"  Warm start:    {warm_start * 1000:.1f} ms, {warm_start_calls} REST calls "
+          f"(snapshot {os.path.getsize(main.SNAPSHOT_FILE) / 1024:.0f} KiB)")
+    print(f"  Alerts:        {len(api.alerts)} messages, "
+          f"{main.metrics.counter_value('swat_alerts_deduplicated_total'):.0f} deduplicated, "
+          f"{main.metrics.counter_value('swat_alert_retries_total'):.0f} retries")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the SWAT playerlist update pipeline")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--players", type=int, default=2000, help="players per region")
+    parser.add_argument("--swat-online", type=int, default=40, help="players per region that are guild members")
+    parser.add_argument("--members", type=int, default=5000, help="guild members")
+    parser.add_argument("--swat-share", type=float, default=0.2)
+    parser.add_argument("--trainee-share", type=float, default=0.1)
+    parser.add_argument("--tag-patterns", default="{name} [SWAT],{name},{name} [CADET],{name} [TRAINEE]",
+                        help="comma separated display name patterns")
+    parser.add_argument("--latency", type=float, default=0.05, help="API latency in seconds")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="latency per Discord REST call")
+    parser.add_argument("--targets", type=int, default=1, help="status channels the embeds are published to")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of API requests answered with 503")
+    parser.add_argument("--churn", type=float, default=0.01, help="share of a roster replaced per request")
+    parser.add_argument("--fivem-resources", type=int, default=300, help="resources listed in info.json")
+    parser.add_argument("--alert-rate-limit", type=float, default=0.0,
+                        help="share of Telegram requests answered with 429")
+    parser.add_argument("--name-noise", type=float, default=0.0,
+                        help="share of member names that differ slightly in-game (clan tag, lookalikes, ...)")
+    parser.add_argument("--fuzzy", action="store_true", help="enable fuzzy name matching")
+    parser.add_argument("--execution-mode", choices=("inline", "process"), default="inline",
+                        help="decode and match the player lists on the loop or in worker processes")
+    parser.add_argument("--single-message", action="store_true", help="publish all regions in one message")
+    parser.add_argument("--keep-rate-limit", action="store_true", help="keep the configured per-host rate limit")
+    parser.add_argument("--trace-allocations", action="store_true", help="measure allocations with tracemalloc")
+    parser.add_argument("--capture", metavar="DIR", help="capture the API responses for replay.py")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
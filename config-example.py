@@ -5,17 +5,89 @@ from datetime import datetime
 # General Bot Settings
 USE_LOCAL_JSON = False
 LOCAL_JSON_FILE = "json-formatting.json"
-CHECK_INTERVAL = 60
-CACHE_UPDATE_INTERVAL = 300
+CHECK_INTERVAL = 60  # Starting poll interval per region
+POLL_INTERVAL_MIN = 20  # Used while SWAT members join/leave or the queue is moving
+POLL_INTERVAL_MAX = 300  # Upper limit when a region is offline or stable
+POLL_BACKOFF_FACTOR = 1.5
+POLL_STABLE_TICKS = 5  # Unchanged ticks before the interval grows
+MAX_CONCURRENT_REGION_UPDATES = 3
+QUEUE_DATA_MAX_AGE = 15  # Regions share the servers endpoint response for this many seconds
+CACHE_REBUILD_INTERVAL = 3600  # Full Discord member cache rebuild, events keep it current in between
+SINGLE_MESSAGE_MODE = False  # Publish all regions as embeds of one message instead of one message per region
+SINGLE_MESSAGE_DELAY = 2  # Region updates within this many seconds are published in one edit
+EMBED_MAX_STALENESS = 300  # Unchanged embeds are only re-edited (to refresh the timestamp) after this many seconds
+
+# Execution: "inline" decodes and matches the player lists on the event loop, "process" in worker processes
+EXECUTION_MODE = "inline"
+EXECUTOR_WORKERS = None  # Worker processes, default one per region (up to the number of CPUs)
 
 # Logging
 PClOGGING = True
 LOG_FILENAME = datetime.now().strftime('%Y-%m-%d_%H-%M-%S.log')
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Roll the log file at this size
+LOG_BACKUP_COUNT = 5
+LOG_RATE_LIMIT = 10  # Messages with the same key per LOG_RATE_WINDOW, the rest is counted and summarized
+LOG_RATE_WINDOW = 60
+
+# Metrics (Prometheus text format, localhost only)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Supervisor
+REGION_UPDATE_TIMEOUT = 45  # Watchdog deadline for one region update, stuck updates are cancelled
+SUPERVISOR_BACKOFF_BASE = 5  # Restart delay of a failed task, doubles up to SUPERVISOR_BACKOFF_MAX
+SUPERVISOR_BACKOFF_MAX = 300
+SUPERVISOR_MAX_FAILURES = 10  # Failures within SUPERVISOR_FAILURE_WINDOW seconds before the bot exits
+SUPERVISOR_FAILURE_WINDOW = 600
+
+# Capture of the raw API responses and member changes for replay.py
+CAPTURE_ENABLED = False
+CAPTURE_DIR = "captures"
+CAPTURE_SEGMENT_BYTES = 20 * 1024 * 1024  # Start a new segment at this (compressed) size
+CAPTURE_MAX_SEGMENTS = 50  # Older segments are deleted
+
+# Presence history (SQLite) for /leaderboard, /stats and /peaktimes
+PRESENCE_ENABLED = True
+PRESENCE_DB_FILE = "presence.sqlite3"
+PRESENCE_FLUSH_INTERVAL = 10  # Events are written in one transaction per this many seconds
+PRESENCE_SESSION_TIMEOUT = 900  # Sessions of a region without data are closed after this many seconds
+PRESENCE_RETENTION_DAYS = 90  # Raw sessions
+PRESENCE_ROLLUP_RETENTION_DAYS = 730  # Daily/hourly rollups
+
+# Event loop: warn when a callback blocks the loop for longer than this many seconds
+LOOP_BLOCK_THRESHOLD = 0.02
 
 # Telegram
+TELEGRAM_ENABLED = False
+TELEGRAM_TOKEN_FILE = "tgtoken.txt"
+TELEGRAM_API_BASE = "https://api.telegram.org"  # Point to a local stub for tests
 CHAT_ID = "CHATID"
+ALERT_QUEUE_SIZE = 100
+ALERT_DEDUP_WINDOW = 600  # Identical alerts within this many seconds are sent once
+ALERT_BATCH_DELAY = 2  # Alerts arriving within this many seconds are sent as one message
+ALERT_MAX_MESSAGE_LENGTH = 4000  # Telegram allows 4096 characters per message
+ALERT_MAX_RETRIES = 5
+
+# HTTP
+HTTP_TIMEOUT = 5
+HTTP_POOL_LIMIT = 20
+HTTP_POOL_LIMIT_PER_HOST = 10
+HTTP_KEEPALIVE_TIMEOUT = 60
+# Token bucket per host: RATE_LIMIT_RATE requests per second, up to RATE_LIMIT_BURST at once
+RATE_LIMIT_RATE = 2
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_OVERRIDES = {
+    # "api.gtacnr.net": (2, 10),
+}
+# Circuit breaker: skip an endpoint after this many failures in a row, backing off exponentially
+CIRCUIT_FAILURE_THRESHOLD = 2
+CIRCUIT_BACKOFF_BASE = 30
+CIRCUIT_BACKOFF_MAX = 600
+STALE_DATA_EXPIRY = 600  # Serve the last good data of a failing endpoint for this many seconds
 
 # Server Data
+API_URL_SERVERS = "https://api.gtacnr.net/cnr/servers"
 API_URLS = {
     "EU1": "https://api.gtacnr.net/cnr/players?serverId=EU1",
     "EU2": "https://api.gtacnr.net/cnr/players?serverId=EU2",
@@ -23,6 +95,8 @@ API_URLS = {
     "NA2": "https://api.gtacnr.net/cnr/players?serverId=US2",
     "SEA": "https://api.gtacnr.net/cnr/players?serverId=SEA",
 }
+# info.json is only downloaded for the restart schedule, liveness is probed via dynamic.json next to it
+FIVEM_INFO_TTL = 6 * 3600
 API_URLS_FIVEM = {
     "EU1": "https://57.129.49.31:30130/info.json",
     "EU2": "https://57.129.49.31:30131/info.json",
@@ -48,6 +122,22 @@ MENTOR_ROLE_ID = 1303048285040410644
 CADET_ROLE_ID = 962226985222959145
 TRAINEE_ROLE_ID = 1033432392758722682
 SWAT_ROLE_ID = 958274314036195359
+LEADERSHIP_ROLE_ID = 958272560905195521
+LEADERSHIP_EMOJI = "⭐"
+
+# Status board: channels that get the embeds, in any guild the bot is in (member roles are read from GUILD_ID)
+STATUS_TARGETS = [STATUS_CHANNEL_ID]
+DISCORD_CHANNEL_CONCURRENCY = 2  # REST calls in flight per channel, sends and edits share one rate limit per channel
+DISCORD_MAX_RETRIES = 3  # Attempts for 5xx responses and connection errors
+DISCORD_RETRY_DELAY = 2  # Backoff before the first retry in seconds, doubles per attempt
+
+# Name matching: in-game names without an exact Discord match
+FUZZY_MATCHING = False  # Match similar [SWAT] names (clan tags, separators, lookalike characters)
+FUZZY_THRESHOLD = 0.75  # Minimum trigram similarity (0-1)
+FUZZY_MAX_CANDIDATES = 20  # Names sharing the most trigrams that are scored
+MEMBER_ALIASES = {
+    # "In-game name": discord_id,
+}
 
 # Ranking
 RANK_HIERARCHY = [
@@ -71,6 +161,9 @@ ROLE_TO_RANK = {
 
 # Files
 EMBEDS_FILE = "embeds-testing.json"
+SNAPSHOT_FILE = "snapshot-testing.json.gz"  # Member cache and region data for a warm start after restarts
+SNAPSHOT_INTERVAL = 60
+SNAPSHOT_MAX_AGE = 3600  # Older snapshots are ignored
 
 # Token Files
 TOKEN_FILE = "token-test.txt"
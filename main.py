@@ -1,208 +1,1388 @@
 import discord
+from discord import app_commands
 from discord.ext import tasks, commands
-import requests, json, datetime, re, pytz, logging, os, sys, aiohttp, asyncio
+import json, datetime, re, pytz, logging, logging.handlers, os, gzip, sys, aiohttp, asyncio, time, hashlib, functools, threading, traceback, queue, atexit, sqlite3, unicodedata, heapq, pickle, multiprocessing
+import concurrent.futures
+from aiohttp import web
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit
 from config import *
-requests.packages.urllib3.disable_warnings()
 
 # Bot setup
+class SwatBot(commands.Bot):
+    async def setup_hook(self):
+        global alert_dispatcher
+        alert_dispatcher = AlertDispatcher()
+        alert_dispatcher.start()
+
+        start_capture_writer()
+        start_presence_writer()
+        await load_stored_embeds()
+        # Before the warm start publishes anything in the configured layout; partial messageables suffice
+        await migrate_stored_embeds()
+        asyncio.create_task(warm_start(), name="warm-start")
+
+        # Slash commands are only registered for our guild, so they are available right away
+        guild = discord.Object(id=GUILD_ID)
+        self.tree.copy_global_to(guild=guild)
+        await self.tree.sync(guild=guild)
+
+    async def close(self):
+        supervisor.stop()
+        if loop_block_detector is not None:
+            loop_block_detector.stop()
+        await stop_metrics_server()
+        save_snapshot.cancel()
+        await save_snapshot()
+        if alert_dispatcher is not None:
+            alert_dispatcher.stop()
+        await close_http_session()
+        shutdown_match_pool()
+        if capture_writer is not None:
+            await asyncio.to_thread(capture_writer.stop)
+        if presence_writer is not None:
+            await asyncio.to_thread(presence_writer.stop)
+        await super().close()
+        log_listener.stop()
+
 intents = discord.Intents.default()
 intents.members = True
-client = commands.Bot(command_prefix="!", intents=intents)
+client = SwatBot(command_prefix="!", intents=intents)
 
 # Logging setup
+# log() only puts records on a queue; a background thread formats them and writes console and file.
 if PClOGGING:
     log_filepath = LOG_FILENAME
 else:
     log_filepath = os.path.join("/opt/swat-server-list/", LOG_FILENAME)
-logging.basicConfig(
-    filename=log_filepath,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+
+class FieldsFormatter(logging.Formatter):
+    # Appends the structured key=value fields passed to log()
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+log_file_handler = logging.handlers.RotatingFileHandler(
+    log_filepath, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
 )
+log_file_handler.setFormatter(FieldsFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_console_handler = logging.StreamHandler(sys.stdout)
+log_console_handler.setFormatter(FieldsFormatter('[%(asctime)s] %(message)s', datefmt='%d.%m.%Y %H:%M:%S'))
+# discord.py prints its own records to the console, they only go to the file here
+log_console_handler.addFilter(logging.Filter("swat"))
+
+log_queue = queue.SimpleQueue()
+logger = logging.getLogger("swat")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+# Records of the libraries (discord, asyncio, ...) go through the same queue into the log file
+logging.getLogger().setLevel(logging.INFO)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, log_file_handler, log_console_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # Global variables
 embeds = []
-discord_cache = {"timestamp": None, "members": {}}
+# generation changes when a match result can change, version on every change of the member indexes
+discord_cache = {"timestamp": None, "members": {}, "swat_index": {}, "tag_index": {}, "generation": 0, "version": 0}
+http_session = None
+rate_limiters = {}
+circuit_breakers = {}
+endpoint_cache = {}  # endpoint key -> validators, body hash and decoded data of the last response
+unverified_responses = {}  # endpoint key -> cache entry replaced by a response that is not decoded yet
+region_state = {}  # region -> last matching result and embed, plus cache hit counters
+restart_schedule = {}  # region -> {"restart_at": epoch seconds or None, "fetched_at": epoch seconds}
+clock = time.time  # Time the API data is judged by; replay.py sets it to the capture time
+queue_cache = {"data": None, "fetched_at": None}
+queue_lock = asyncio.Lock()
+stored_embeds = {}  # channel id -> stored messages of that status target
+stored_embeds_lock = asyncio.Lock()
+single_message_state = {"task": None, "dirty": False}
+channel_semaphores = {}  # channel id -> semaphore for the REST calls of that channel
+SINGLE_MESSAGE_KEY = "ALL"
+scheduler = None
+alert_dispatcher = None
+loop_block_detector = None
+capture_writer = None
+presence_writer = None
+presence_sessions = {}  # region -> {username: open session}, see track_presence
+# Latest matched players of all regions, replaced as a whole by update_player_index
+player_index = {"regions": {}, "by_name": {}, "by_id": {}, "updated_at": None}
+
+class Metrics:
+    """
+    Small in-process registry for counters, gauges and histograms, rendered in Prometheus text format.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.active = {}  # region -> {stage: start}, the stages a region is currently in (for the watchdog)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                hist["buckets"][i] += 1
+                break
+        hist["sum"] += value
+        hist["count"] += 1
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        active = self.active.setdefault(labels["region"], {}) if "region" in labels else {}
+        active[stage] = start
+        try:
+            yield
+        finally:
+            active.pop(stage, None)
+            self.observe("swat_stage_duration_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def counter_value(self, name, **labels):
+        return self.counters.get(self._key(name, labels), 0)
+
+    def gauge_value(self, name, **labels):
+        return self.gauges.get(self._key(name, labels), 0)
+
+    @staticmethod
+    def _labels(labels, **extra):
+        items = list(labels) + list(extra.items())
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(92) + chr(34))}"' for k, v in items) + "}"
+
+    def render(self):
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), value in sorted(self.gauges.items()):
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), hist in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, hist["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else bound
+                lines.append(f"{name}_bucket{self._labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist['sum']}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def stage_summary(self):
+        # Aggregates the stage histograms over all regions: stage -> (count, average seconds, ~p95 seconds)
+        stages = {}
+        for (name, labels), hist in self.histograms.items():
+            if name != "swat_stage_duration_seconds":
+                continue
+            stage = dict(labels)["stage"]
+            agg = stages.setdefault(stage, {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0})
+            agg["buckets"] = [a + b for a, b in zip(agg["buckets"], hist["buckets"])]
+            agg["sum"] += hist["sum"]
+            agg["count"] += hist["count"]
+        summary = {}
+        for stage, agg in stages.items():
+            p95, cumulative = self.BUCKETS[-1], 0
+            for bound, count in zip(self.BUCKETS, agg["buckets"]):
+                cumulative += count
+                if cumulative >= agg["count"] * 0.95:
+                    p95 = bound
+                    break
+            summary[stage] = (agg["count"], agg["sum"] / agg["count"] if agg["count"] else 0.0, p95)
+        return summary
+
+metrics = Metrics()
+metrics_runner = None
+
+def timed(stage):
+    # Records the duration of an async function as a stage; a region as first argument becomes a label
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            labels = {"region": args[0]} if args and isinstance(args[0], str) else {}
+            with metrics.timer(stage, **labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Name normalization for Discord <-> in-game matching
+SWAT_PREFIX_RE = re.compile(r'^\[SWAT\]\s*', re.IGNORECASE)
+SWAT_SUFFIX_RE = re.compile(r'\s*\[SWAT\]$', re.IGNORECASE)
+MEMBER_TAG_RE = re.compile(r'\s*\[(CADET|TRAINEE|SWAT)\]$', re.IGNORECASE)
+RANK_ORDER = {rank: i for i, rank in enumerate(RANK_HIERARCHY)}
+# Fuzzy matching: lookalike characters, clan tags like [ABC] or (ABC) and separators are ignored.
+# Digits are kept, "Sniper2004" and "Sniper2005" are different players
+CONFUSABLES = str.maketrans({
+    "$": "s", "@": "a", "!": "i", "|": "l",
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s",
+})
+DIGITS_RE = re.compile(r'\D+')
+CLAN_TAG_RE = re.compile(r'[\[\(\{][^\]\)\}]{1,8}[\]\)\}]')
+SEPARATOR_RE = re.compile(r'[\W_]+')
 
 ERROR_BUFFER_COOLDOWN_SECONDS = 5 * 60  # 300s => 5 minutes
-error_buffer = []  # collects error/critical messages
-error_buffer_start_time = datetime.now()
+error_buffer = []  # collects error/critical messages, flushed by flush_error_buffer
+LOG_LEVELS = {"warning": logging.WARNING, "error": logging.ERROR, "critical": logging.CRITICAL}
+
+def read_text_file(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+def write_text_file(path, content):
+    # Write to a temporary file first, so a crash never leaves a half written file behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
 def send_telegram(message_temp):
-    with open("tgtoken.txt", "r") as file:
-        TGTOKEN = file.read().strip()
-    url = f"https://api.telegram.org/bot{TGTOKEN}/sendMessage?chat_id={CHAT_ID}&text={message_temp}"
-    # requests.get(url).json()
+    # Never blocks: the alert is queued for the AlertDispatcher, from any thread
+    if TELEGRAM_ENABLED and alert_dispatcher is not None:
+        alert_dispatcher.submit_threadsafe(message_temp)
 
-def log(log_type, content):
-    global error_buffer, error_buffer_start_time
-    
-    ts = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
-    print(f"[{ts}] {content}")
-    
-    # Always log to file (same as before)
-    if log_type == "warning":
-        logging.warning(content)
-    elif log_type == "error":
-        logging.error(content)
-        # Add to our error buffer
-        error_buffer.append(f"[{ts}] ERROR: {content}")
-    elif log_type == "critical":
-        logging.critical(content)
-        # Add to our error buffer
-        error_buffer.append(f"[{ts}] CRITICAL: {content}")
-    else:
-        logging.info(content)
-    
-    # -- After logging, check if 5 minutes have passed since we started this buffer
-    now_dt = datetime.now()
-    elapsed = (now_dt - error_buffer_start_time).total_seconds()
-    if elapsed >= ERROR_BUFFER_COOLDOWN_SECONDS:
-        # It's been at least 5 minutes
-        if error_buffer:
-            # We have some errors to send, combine them into one message
-            summary_message = (
-                "Fehler/Fehlermeldungen im letzten 5-Minuten-Fenster:\n\n"
-                + "\n".join(error_buffer)
-            )
-            send_telegram(summary_message)
-            
-            # Clear the buffer
-            error_buffer.clear()
-        
-        # Reset the start time so we start a fresh 5-minute window
-        error_buffer_start_time = now_dt
+class AlertDispatcher:
+    """
+    Sends alerts to Telegram from a background task. Alerts go into a bounded queue (the oldest alert is
+    dropped when it is full), identical alerts within ALERT_DEDUP_WINDOW are only sent once with a repeat
+    count, and queued alerts are batched into messages of at most ALERT_MAX_MESSAGE_LENGTH characters.
+    Telegram rate limits (429) and errors are retried with backoff inside the task, never in the caller.
+    """
+    def __init__(self):
+        self.loop = None
+        self.queue = None
+        self.task = None
+        self.token = None
+        self.recent = {}  # message -> [window start, repeats within the window]
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self.task = supervisor.spawn("alert-dispatcher", self.run)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def submit_threadsafe(self, message):
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.submit(message)
+        else:
+            self.loop.call_soon_threadsafe(self.submit, message)
+
+    def submit(self, message):
+        now = time.monotonic()
+        entry = self.recent.get(message)
+        if entry and now - entry[0] < ALERT_DEDUP_WINDOW:
+            entry[1] += 1
+            metrics.inc("swat_alerts_deduplicated_total")
+            return
+        text = message
+        if entry and entry[1]:
+            text = f"{message}\n(+{entry[1]}x in den letzten {ALERT_DEDUP_WINDOW}s)"
+        self.recent = {m: e for m, e in self.recent.items() if now - e[0] < ALERT_DEDUP_WINDOW}
+        # Keyed by the original message, the repeat count is only added to the queued text
+        self.recent[message] = [now, 0]
+
+        if self.queue.full():
+            self.queue.get_nowait()
+            metrics.inc("swat_alerts_dropped_total")
+        self.queue.put_nowait(text)
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Give related alerts a moment to arrive, so they end up in the same message
+            await asyncio.sleep(ALERT_BATCH_DELAY)
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                for text in self.pack(batch):
+                    await self.send_with_retry(text)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    @staticmethod
+    def pack(messages):
+        packed, current = [], ""
+        for message in messages:
+            # Messages longer than the limit (e.g. a large error summary) are split into several parts
+            parts = [message[i:i + ALERT_MAX_MESSAGE_LENGTH] for i in range(0, len(message), ALERT_MAX_MESSAGE_LENGTH)]
+            for part in parts or [""]:
+                if current and len(current) + 2 + len(part) > ALERT_MAX_MESSAGE_LENGTH:
+                    packed.append(current)
+                    current = ""
+                current = f"{current}\n\n{part}" if current else part
+        if current:
+            packed.append(current)
+        return packed
+
+    async def send_with_retry(self, text):
+        delay = 1
+        for attempt in range(1, ALERT_MAX_RETRIES + 1):
+            try:
+                status, retry_after = await self.post(text)
+                if status == 200:
+                    metrics.inc("swat_alerts_sent_total")
+                    return
+                if status != 429 and status < 500:
+                    # log() would queue another alert for this error, so only write it to the log file
+                    logger.warning(f"Telegram hat die Nachricht abgelehnt (HTTP {status}).")
+                    return
+                wait = retry_after if status == 429 and retry_after else delay
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                logger.warning(f"Telegram-Nachricht konnte nicht gesendet werden: {e}")
+                wait = delay
+            metrics.inc("swat_alert_retries_total")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, 60)
+        logger.warning(f"Telegram-Nachricht nach {ALERT_MAX_RETRIES} Versuchen verworfen.")
+
+    async def post(self, text):
+        # Returns (HTTP status, retry_after seconds for 429)
+        if self.token is None:
+            self.token = (await asyncio.to_thread(read_text_file, TELEGRAM_TOKEN_FILE)).strip()
+        session = await get_http_session()
+        url = f"{TELEGRAM_API_BASE}/bot{self.token}/sendMessage"
+        async with session.post(url, json={"chat_id": CHAT_ID, "text": text}) as resp:
+            retry_after = None
+            if resp.status == 429:
+                try:
+                    retry_after = (await resp.json())["parameters"]["retry_after"]
+                except Exception:
+                    retry_after = None
+            return resp.status, retry_after
+
+class LogSampler:
+    """
+    Rate limits repetitive log messages: per key, only LOG_RATE_LIMIT messages are written per
+    LOG_RATE_WINDOW seconds. The number of suppressed messages is reported when the window ends.
+    """
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.windows = {}  # key -> [window start, count, suppressed]
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        # Returns (allowed, suppressed count of the previous window)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.windows.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = entry[2] if entry else 0
+                self.windows[key] = [now, 1, 0]
+                if len(self.windows) > 10000:
+                    self.windows = {k: v for k, v in self.windows.items() if now - v[0] < self.window}
+                return True, suppressed
+            if entry[1] < self.limit:
+                entry[1] += 1
+                return True, 0
+            entry[2] += 1
+            return False, 0
+
+log_sampler = LogSampler(LOG_RATE_LIMIT, LOG_RATE_WINDOW)
+
+def log(log_type, content, key=None, **fields):
+    """
+    Logs a message with optional structured fields (e.g. region=EU1 stage=fetch_players).
+    Messages with the same key (default: the message itself) are rate limited.
+    """
+    level = LOG_LEVELS.get(log_type, logging.INFO)
+    allowed, suppressed = log_sampler.allow(key or content)
+    if suppressed:
+        logger.log(level, f"{suppressed} ähnliche Meldungen unterdrückt: {content}", extra={"fields": fields})
+    if not allowed:
+        return
+    logger.log(level, content, extra={"fields": fields})
+
+    if level >= logging.ERROR:
+        ts = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
+        error_buffer.append(f"[{ts}] {logging.getLevelName(level)}: {content}")
+
+@tasks.loop(seconds=ERROR_BUFFER_COOLDOWN_SECONDS)
+async def flush_error_buffer():
+    # Sends all errors of the last 5 minutes as one message
+    if error_buffer:
+        summary_message = (
+            "Fehler/Fehlermeldungen im letzten 5-Minuten-Fenster:\n\n"
+            + "\n".join(error_buffer)
+        )
+        error_buffer.clear()
+        send_telegram(summary_message)
 
 @client.event
 async def on_ready():
+    global scheduler
     log("info", f"Bot ist online als {client.user}")
-    update_game_status.start()
+    resolve_emojis()
+    # on_ready fires again after reconnects, the tasks only need to be started once
+    if scheduler is None:
+        start_loop_block_detector()
+        for channel_id in STATUS_TARGETS:
+            if client.get_channel(channel_id) is None:
+                log("error", f"Status-Kanal {channel_id} nicht gefunden.")
+        await update_discord_cache()
+        for name, loop in (("discord-cache", discord_cache_loop), ("error-buffer", flush_error_buffer),
+                           ("snapshot", save_snapshot)):
+            loop.start()
+            supervisor.watch(name, loop)
+        supervisor.start()
+        scheduler = RegionScheduler(list(API_URLS.keys()))
+        scheduler.start()
+        supervisor.spawn("loop-lag", monitor_loop_lag)
+        if METRICS_ENABLED:
+            await start_metrics_server()
+
+@client.event
+async def on_guild_emojis_update(guild, before, after):
+    if guild.id == GUILD_ID:
+        resolve_emojis()
 
 @client.event
 async def on_error(event, *args, **kwargs):
-    log("critical", f'Fehler im Event {event}: {args} {kwargs}')
-    sys.exit(1)
+    # Caches and tasks stay as they are, only repeated failures end the process (see Supervisor)
+    log("critical", f'Fehler im Event {event}: {args} {kwargs}\n{traceback.format_exc()}')
+    supervisor.record_failure(f"Event {event}")
+
+class TokenBucket:
+    """
+    Simple token bucket: allows `burst` requests at once and refills with `rate` tokens per second.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def get_rate_limiter(url):
+    host = urlsplit(url).netloc
+    if host not in rate_limiters:
+        rate, burst = RATE_LIMIT_OVERRIDES.get(host, (RATE_LIMIT_RATE, RATE_LIMIT_BURST))
+        rate_limiters[host] = TokenBucket(rate, burst)
+    return rate_limiters[host]
+
+async def get_http_session():
+    # One pooled session for all API requests, so connections are kept alive between cycles
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return http_session
+
+async def close_http_session():
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+class CircuitOpenError(Exception):
+    pass
+
+class InvalidPayloadError(ValueError):
+    pass
+
+class HTTPStatusError(aiohttp.ClientError):
+    def __init__(self, url, status):
+        super().__init__(f"HTTP {status} für {url}")
+        self.url = url
+        self.status = status
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker. After CIRCUIT_FAILURE_THRESHOLD failures in a row the endpoint is skipped
+    for an exponentially growing backoff, then a single half-open probe decides whether it is closed again.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() >= self.open_until:
+            self.state = "half_open"
+            return True  # this request is the probe
+        return False
 
+    def record_success(self):
+        if self.state != "closed":
+            log("info", f"Endpunkt {self.key} ist wieder erreichbar.", endpoint=self.key)
+        self.state = "closed"
+        self.failures = 0
+        metrics.set("swat_circuit_open", 0, endpoint=self.key)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            backoff = min(CIRCUIT_BACKOFF_BASE * 2 ** max(0, self.failures - CIRCUIT_FAILURE_THRESHOLD), CIRCUIT_BACKOFF_MAX)
+            if self.state == "closed":
+                log("warning", f"Endpunkt {self.key} wird für {backoff:.0f}s übersprungen.", endpoint=self.key)
+            self.state = "open"
+            self.open_until = time.monotonic() + backoff
+            metrics.set("swat_circuit_open", 1, endpoint=self.key)
+
+def get_circuit_breaker(key):
+    if key not in circuit_breakers:
+        circuit_breakers[key] = CircuitBreaker(key)
+    return circuit_breakers[key]
+
+async def fetch_json(url, key, **kwargs):
+    """
+    GETs a JSON endpoint through its circuit breaker. Raises CircuitOpenError while the endpoint is skipped.
+    Returns (data, changed), see request_json.
+    """
+    breaker = get_circuit_breaker(key)
+    if not breaker.allow():
+        metrics.inc("swat_circuit_skipped_total", endpoint=key)
+        raise CircuitOpenError(key)
+    try:
+        result = await request_json(url, key, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        if key in endpoint_cache:
+            endpoint_cache[key]["failed"] = True
+        raise
+    # Undecoded responses only count once they are decoded, see confirm_response
+    if key not in unverified_responses:
+        breaker.record_success()
+    endpoint_cache[key]["ok_at"] = clock()
+    endpoint_cache[key]["failed"] = False
+    return result
+
+def confirm_response(key):
+    # The response that request_json cached undecoded was decoded successfully
+    if key in unverified_responses:
+        del unverified_responses[key]
+        get_circuit_breaker(key).record_success()
+
+def reject_response(key):
+    """
+    Treats a response that request_json cached undecoded, and that could not be decoded, like a failed request:
+    the previous entry is restored and the circuit breaker counts a failure. Returns the last good data or None.
+    """
+    get_circuit_breaker(key).record_failure()
+    previous = unverified_responses.pop(key, None)
+    if previous is None:
+        endpoint_cache.pop(key, None)
+        return None
+    previous["failed"] = True
+    endpoint_cache[key] = previous
+    return last_good(key)
+
+def last_good(key):
+    # Data of the last successful response, as long as it is not older than STALE_DATA_EXPIRY
+    cached = endpoint_cache.get(key)
+    if cached and clock() - cached["ok_at"] < STALE_DATA_EXPIRY:
+        return cached["data"]
+    return None
+
+def stale_since(key):
+    # Time of the last successful response if the endpoint currently fails and its data is still served
+    cached = endpoint_cache.get(key)
+    if cached and cached["failed"] and clock() - cached["ok_at"] < STALE_DATA_EXPIRY:
+        return cached["ok_at"]
+    return None
+
+async def request_json(url, key, decode=True, **kwargs):
+    """
+    GETs a JSON endpoint, sending If-None-Match / If-Modified-Since when the last response had validators.
+    Returns (data, changed). On a 304 or an identical body the previous data is returned without decoding.
+    With decode=False the data is the raw body, for decoding in a worker process.
+    """
+    cached = endpoint_cache.get(key)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    status, raw, response_headers = await http_get(url, key, headers, **kwargs)
+    if status == 304 and cached:
+        metrics.inc("swat_http_responses_total", endpoint=key, result="not_modified")
+        return cached["data"], False
+    if status >= 400:
+        raise HTTPStatusError(url, status)
+    etag = response_headers.get("ETag")
+    last_modified = response_headers.get("Last-Modified")
+
+    # APIs without validators: compare a hash of the raw bytes instead
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+    if cached and cached["digest"] == digest:
+        cached["etag"] = etag
+        cached["last_modified"] = last_modified
+        metrics.inc("swat_http_responses_total", endpoint=key, result="unchanged")
+        return cached["data"], False
+    metrics.inc("swat_http_responses_total", endpoint=key, result="changed")
+
+    if decode:
+        data = json.loads(raw.decode('utf-8'))
+    else:
+        data = raw
+        # The last entry that was decoded, restored by reject_response if this body turns out to be invalid
+        unverified_responses.setdefault(key, cached)
+    endpoint_cache[key] = {"etag": etag, "last_modified": last_modified, "digest": digest, "data": data,
+                           "ok_at": clock(), "failed": False}
+    return data, True
+
+async def http_get(url, key, headers, **kwargs):
+    """
+    The one low-level GET of the API fetchers, returns (status, body bytes, validator headers). Captures go
+    through here, and replay.py replaces this function to serve recorded responses.
+    """
+    await get_rate_limiter(url).acquire()
+    session = await get_http_session()
+    async with session.get(url, headers=headers, **kwargs) as resp:
+        raw = await resp.read()
+        response_headers = {"ETag": resp.headers.get("ETag"), "Last-Modified": resp.headers.get("Last-Modified")}
+        status = resp.status
+    if capture_writer is not None:
+        capture_writer.record("http", key=key, url=url, status=status, headers=response_headers,
+                              body=raw.decode("utf-8", "surrogateescape"))
+    return status, raw, response_headers
+
+def endpoint_digest(key):
+    cached = endpoint_cache.get(key)
+    return cached["digest"] if cached else None
+
+@timed("fetch_players")
 async def fetch_players(region):
+    # Returns (players, changed), changed is False if the player list is the same as last time
     if USE_LOCAL_JSON:
         try:
-            with open(LOCAL_JSON_FILE, "r", encoding='utf-8') as file:
-                return json.load(file)
+            content = await asyncio.to_thread(read_text_file, LOCAL_JSON_FILE)
+            return json.loads(content), True
         except (FileNotFoundError, json.JSONDecodeError) as e:
             log("error", f"Fehler beim Lesen der JSON-Datei: {e}")
-            return []
+            return [], True
 
     url = API_URLS.get(region)
     if not url:
         log("error", f"Keine API-URL für Region {region} definiert.")
-        return []
+        return [], True
 
+    key = f"players:{region}"
     try:
-        # We add a timeout and a short sleep before each request:
-        await asyncio.sleep(1)  # Tiny delay before each fetch
-        timeout = aiohttp.ClientTimeout(total=5)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as resp:
-                resp.raise_for_status()
-                text = await resp.text(encoding='utf-8')
-                data = json.loads(text)
-                return data
+        return await fetch_json(url, key, decode=EXECUTION_MODE != "process")
+    except CircuitOpenError:
+        pass
     except asyncio.TimeoutError:
-        log("error", f"Timeout beim Abrufen der API-Daten für Region {region}")
-        return None
-    except aiohttp.ClientError as e:
-        log("error", f"Fehler beim Abrufen der API-Daten: {e}")
-        return None
+        metrics.inc("swat_fetch_errors_total", endpoint="players", region=region, reason="timeout")
+        log("error", f"Timeout beim Abrufen der API-Daten für Region {region}", key=f"players_timeout:{region}", region=region, stage="fetch_players")
+    except (aiohttp.ClientError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        metrics.inc("swat_fetch_errors_total", endpoint="players", region=region, reason="error")
+        log("error", f"Fehler beim Abrufen der API-Daten: {e}", key=f"players_error:{region}", region=region, stage="fetch_players")
+    # Serve the last good player list (as unchanged) until it expires
+    players = last_good(key)
+    return players, players is None
 
+@timed("getqueuedata")
 async def getqueuedata():
     try:
-        r = requests.get("https://api.gtacnr.net/cnr/servers", timeout=3)
-        r.encoding = 'utf-8'
-        r.raise_for_status()
-        data = json.loads(r.text)
-
-        queue_info = {entry["Id"]: entry for entry in data}
-        if "US1" in queue_info:
-            queue_info["NA1"] = queue_info.pop("US1")
-        if "US2" in queue_info:
-            queue_info["NA2"] = queue_info.pop("US2")
-        if "US3" in queue_info:
-            queue_info["NA3"] = queue_info.pop("US3")
-
-        return queue_info
-
-    except requests.Timeout:
-        log("error", "Timeout beim Abrufen der Queue-Daten.")
+        data, _ = await fetch_json(API_URL_SERVERS, "servers")
+    except CircuitOpenError:
+        data = last_good("servers")
+    except asyncio.TimeoutError:
+        metrics.inc("swat_fetch_errors_total", endpoint="servers", reason="timeout")
+        log("error", "Timeout beim Abrufen der Queue-Daten.", stage="getqueuedata")
+        data = last_good("servers")
+    except (aiohttp.ClientError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        metrics.inc("swat_fetch_errors_total", endpoint="servers", reason="error")
+        log("error", f"Fehler beim Abrufen der Queue-Daten: {e}", key="queue_error", stage="getqueuedata")
+        data = last_good("servers")
+    if data is None:
         return None
 
-    except requests.RequestException as e:
-        log("error", f"Fehler beim Abrufen der Queue-Daten: {e}")
+    queue_info = {entry["Id"]: entry for entry in data}
+    if "US1" in queue_info:
+        queue_info["NA1"] = queue_info.pop("US1")
+    if "US2" in queue_info:
+        queue_info["NA2"] = queue_info.pop("US2")
+    if "US3" in queue_info:
+        queue_info["NA3"] = queue_info.pop("US3")
+
+    return queue_info
+
+async def fetch_fivem(region, url, key):
+    try:
+        data, _ = await fetch_json(url, key, ssl=False)
+        return data
+    except CircuitOpenError:
+        return last_good(key)
+    except Exception as e:
+        reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+        metrics.inc("swat_fetch_errors_total", endpoint="fivem", region=region, reason=reason)
+        log("warning", f"Fehler beim Abrufen der Fivem Daten {region}: {e}", key=f"fivem_error:{region}", region=region, stage="get_fivem_data")
+        return last_good(key)
+
+async def get_queue_data():
+    # All region tasks share one servers request per QUEUE_DATA_MAX_AGE; concurrent callers wait for it
+    async with queue_lock:
+        fetched_at = queue_cache["fetched_at"]
+        if fetched_at is None or time.monotonic() - fetched_at >= QUEUE_DATA_MAX_AGE:
+            data = await getqueuedata()
+            # A failure without last good data is not cached, the next region tries again
+            # (the circuit breaker keeps that cheap while the endpoint is down)
+            if data is None:
+                return None
+            queue_cache["data"] = data
+            queue_cache["fetched_at"] = time.monotonic()
+        return queue_cache["data"]
+
+def fivem_probe_url(info_url):
+    # dynamic.json is served next to info.json and only a few hundred bytes (no resource list)
+    return info_url.rsplit("/", 1)[0] + "/dynamic.json"
+
+@timed("get_fivem_data")
+async def get_fivem_data(region):
+    """
+    Returns {"restart_at": epoch seconds or None} while the FiveM server answers, otherwise None.
+    Liveness comes from dynamic.json on every call. The full info.json is only downloaded for the restart
+    schedule: after FIVEM_INFO_TTL, or once the predicted restart has passed.
+    """
+    url = API_URLS_FIVEM.get(region)
+    if not url:
+        return None
+    if await fetch_fivem(region, fivem_probe_url(url), f"fivem_probe:{region}") is None:
         return None
 
-async def get_fivem_data():
-    fivem_data = {}
-    async with aiohttp.ClientSession() as session:
-        for region, url in API_URLS_FIVEM.items():
-            try:
-                async with session.get(url, ssl=False, timeout=aiohttp.ClientTimeout(total=5)) as response:
-                    response.raise_for_status()
-                    text = await response.text(encoding='utf-8')
-                    fivem_data[region] = json.loads(text)
-                    await asyncio.sleep(1.5)
-            except Exception as e:
-                log("warning", f"Fehler beim Abrufen der Fivem Daten {region}: {e}")
-                fivem_data[region] = None
-    return fivem_data
+    now = clock()
+    schedule = restart_schedule.get(region)
+    if (schedule is None or now - schedule["fetched_at"] >= FIVEM_INFO_TTL
+            or (schedule["restart_at"] is not None and now >= schedule["restart_at"])):
+        key = f"fivem:{region}"
+        info = await fetch_fivem(region, url, key)
+        # The in-game time of a last known good response is outdated, only fresh responses are used
+        if info is not None and not stale_since(key):
+            schedule = {"restart_at": parse_restart_at(info, now), "fetched_at": now}
+            restart_schedule[region] = schedule
+            metrics.inc("swat_restart_schedule_refresh_total", region=region)
+    return {"restart_at": schedule["restart_at"] if schedule else None}
 
 async def update_discord_cache():
+    # The cache is kept current by the member events below; this full rebuild is only a consistency check
     now = datetime.now()
-    if discord_cache["timestamp"] and now - discord_cache["timestamp"] < timedelta(seconds=CACHE_UPDATE_INTERVAL):
-        log("info", "Discord-Cache ist aktuell. Kein Update erforderlich.")
-        return
     guild = client.get_guild(GUILD_ID)
     if not guild:
         log("error", f"Bot ist in keinem Server mit der ID {GUILD_ID}.")
         return
-    dc_members = {m.display_name: {"id": m.id, "roles": [r.id for r in m.roles]} for m in guild.members}
-    discord_cache.update({"timestamp": now, "members": dc_members})
-    
-    
-    activity = []
-    for discord_name, details in discord_cache["members"].items():
-        normalized_name = re.sub(r'\s*\[SWAT\]$', '', discord_name, flags=re.IGNORECASE)
-        if 1360118841895686170 in details["roles"]: # 1328622646283341869
-            activity.append({
-                "username": normalized_name,
-                "rank": get_rank_from_roles(details["roles"]),
-                "id": details["id"]
-            })
-    
-    for i in activity:
-        xabcde = str(i["username"]) + " - " + str(i["rank"])  + " - " + str(i["id"])
-        log("info", xabcde)
-    
-    log("info", "Discord-Cache wurde aktualisiert!")
 
-def time_convert(time_string):
-    # Next Restart Time converter for FiveM
+    members = {}
+    for m in guild.members:
+        members[m.id] = build_member_entry(m.id, m.display_name, [r.id for r in m.roles])
+    swat_index, tag_index = build_name_indexes(members)
+
+    # Count members the events missed (only meaningful after the first build)
+    drift = 0
+    if discord_cache["timestamp"]:
+        old_members = discord_cache["members"]
+        drift = sum(
+            1 for member_id, entry in members.items()
+            if member_id not in old_members
+            or old_members[member_id]["name"] != entry["name"]
+            or old_members[member_id]["roles"] != entry["roles"]
+        )
+        drift += sum(1 for member_id in old_members if member_id not in members)
+
+    discord_cache.update({
+        "timestamp": now,
+        "members": members,
+        "swat_index": swat_index,
+        "tag_index": tag_index,
+        "generation": discord_cache["generation"] + 1,
+        "version": discord_cache["version"] + 1,
+    })
+    if FUZZY_MATCHING:
+        get_fuzzy_matcher()
+    if capture_writer is not None:
+        capture_writer.record("members", members=[(e["id"], e["name"], e["roles"]) for e in members.values()])
+
+    if drift:
+        log("warning", f"Discord-Cache neu aufgebaut, {drift} Abweichungen korrigiert.")
+    log("info", f"Discord-Cache wurde aktualisiert! ({len(members)} Mitglieder)")
+
+def cache_put_member(member_id, display_name, roles):
+    # Applies a single member change to the cache and both name indexes
+    old = unindex_member(member_id)
+    if capture_writer is not None:
+        capture_writer.record("member", id=member_id, name=display_name, roles=roles)
+    entry = build_member_entry(member_id, display_name, roles)
+    discord_cache["members"][member_id] = entry
+    index_add(discord_cache["swat_index"], entry["swat_key"], entry)
+    index_add(discord_cache["tag_index"], entry["tag_key"], entry)
+    member_changed(old, entry)
+
+def cache_remove_member(member_id):
+    entry = unindex_member(member_id)
+    if entry is None:
+        return
+    if capture_writer is not None:
+        capture_writer.record("member_remove", id=member_id)
+    member_changed(entry, None)
+
+def unindex_member(member_id):
+    entry = discord_cache["members"].pop(member_id, None)
+    if entry is not None:
+        index_remove(discord_cache["swat_index"], entry["swat_key"], member_id)
+        index_remove(discord_cache["tag_index"], entry["tag_key"], member_id)
+    return entry
+
+def matching_view(entry):
+    # What match_usernames and the FuzzyMatcher read from a member entry
+    if entry is None:
+        return None
+    has_swat_role = SWAT_ROLE_ID in entry["roles"] or MENTOR_ROLE_ID in entry["roles"]
+    return tuple(entry[field] for field in MATCH_ENTRY_FIELDS) + (entry["swat_key"], entry["tag_key"], has_swat_role)
+
+def affects_matching(entry):
+    """
+    Members with a SWAT/mentor/cadet/trainee role, a rank or an alias can match any player. The others only
+    match [SWAT] players with exactly their name, which only matters for a cached result while one is online.
+    """
+    if entry is None:
+        return False
+    view = matching_view(entry)
+    return (view[-1] or entry["member_type"] or entry["rank"] or entry["is_leader"]
+            or entry["id"] in MEMBER_ALIASES.values() or entry["swat_key"] in player_index["by_name"])
+
+def member_changed(old, new):
+    # A new generation invalidates every cached match result and the fuzzy matcher
+    discord_cache["version"] += 1
+    if matching_view(old) != matching_view(new) and (affects_matching(old) or affects_matching(new)):
+        discord_cache["generation"] += 1
+
+def restore_member_cache(members, timestamp):
+    # Rebuilds the cache from (id, display name, roles) tuples of a snapshot or capture; the indexes are derived
+    members = {m[0]: build_member_entry(m[0], m[1], m[2]) for m in members}
+    swat_index, tag_index = build_name_indexes(members)
+    discord_cache.update({
+        "timestamp": timestamp,
+        "members": members,
+        "swat_index": swat_index,
+        "tag_index": tag_index,
+        "generation": discord_cache["generation"] + 1,
+        "version": discord_cache["version"] + 1,
+    })
+
+def member_roles(member):
+    return [r.id for r in member.roles]
+
+@client.event
+async def on_member_join(member):
+    if member.guild.id != GUILD_ID:
+        return
+    cache_put_member(member.id, member.display_name, member_roles(member))
+
+@client.event
+async def on_member_remove(member):
+    if member.guild.id != GUILD_ID:
+        return
+    cache_remove_member(member.id)
+
+@client.event
+async def on_member_update(before, after):
+    if after.guild.id != GUILD_ID:
+        return
+    if before.display_name != after.display_name or before.roles != after.roles:
+        cache_put_member(after.id, after.display_name, member_roles(after))
+
+@client.event
+async def on_user_update(before, after):
+    # A changed global name also changes the display name of members without a nickname
+    if before.display_name == after.display_name:
+        return
+    guild = client.get_guild(GUILD_ID)
+    member = guild.get_member(after.id) if guild else None
+    if member:
+        cache_put_member(member.id, member.display_name, member_roles(member))
+
+def restart_minutes(time_string):
+    # Next Restart Time converter for FiveM: real minutes until the restart (an in-game minute is a real second)
     m = re.match(r'^(.+) (\d{2}):(\d{2})$', time_string)
-    if not m: return "*Restarting now*"
+    if not m: return 0
     d, hh, mm = m.groups()
     hh, mm = int(hh), int(mm)
     days = ['Saturday','Friday','Thursday','Wednesday','Tuesday','Monday','Sunday']
-    total_hours = (days.index(d)*24*60 + (24-hh-1)*60 + (60-mm))//60
-    if not total_hours: return "*Restarting now*"
-    h, r = divmod(total_hours, 60)
-    hs = f"{h} hour{'s'*(h!=1)}" if h else ""
-    rs = f"{r} minute{'s'*(r!=1)}" if r else ""
-    return f"*Next restart in ~{hs+' and '+rs if hs and rs else hs or rs}*"
+    return (days.index(d)*24*60 + (24-hh-1)*60 + (60-mm))//60
+
+def parse_restart_at(info, now):
+    # Absolute time of the next restart from an info.json, rendered as a Discord timestamp
+    try:
+        return now + restart_minutes(info["vars"]["Time"]) * 60
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def restart_countdown(restart_at):
+    if restart_at is None:
+        return "*No restart data available!*"
+    # Relative timestamp, Discord counts it down client-side, so the embed does not change every minute
+    return f"*Next restart <t:{int(restart_at)}:R>*"
 
 def get_rank_from_roles(roles):
     for r_id, rank in ROLE_TO_RANK.items():
         if r_id in roles: return rank
     return None
 
-async def create_embed(region, matching_players, queue_data, fivem_data):
+def build_member_entry(member_id, display_name, roles):
+    """
+    Precomputes everything the matching needs from a member's roles, so it is done once per member change.
+    """
+    role_set = set(roles)
+    rank = get_rank_from_roles(role_set)
+    if CADET_ROLE_ID in role_set:
+        member_type = "cadet"
+    elif TRAINEE_ROLE_ID in role_set:
+        member_type = "trainee"
+    else:
+        member_type = None
+    return {
+        "id": member_id,
+        "name": display_name,
+        "roles": roles,
+        "rank": rank,
+        "rank_order": RANK_ORDER.get(rank, len(RANK_HIERARCHY)),
+        "swat_type": "mentor" if MENTOR_ROLE_ID in role_set else "SWAT",
+        "member_type": member_type,
+        "is_leader": LEADERSHIP_ROLE_ID in role_set,
+        # swat_key: name without "[SWAT]", used for players with the [SWAT] tag in-game
+        # tag_key: name without "[SWAT]"/"[CADET]"/"[TRAINEE]", used for all other players
+        "swat_key": SWAT_SUFFIX_RE.sub('', display_name).casefold(),
+        "tag_key": MEMBER_TAG_RE.sub('', display_name).casefold(),
+    }
+
+def index_add(index, key, entry):
+    # Several members can share a name; the list is kept ordered so the highest rank comes first
+    entries = index.setdefault(key, [])
+    entries.append(entry)
+    entries.sort(key=lambda e: (e["rank_order"], e["id"]))
+
+def index_remove(index, key, member_id):
+    entries = [e for e in index.get(key, ()) if e["id"] != member_id]
+    if entries:
+        index[key] = entries
+    else:
+        index.pop(key, None)
+
+def build_name_indexes(members):
+    swat_index = {}
+    tag_index = {}
+    for entry in members.values():
+        index_add(swat_index, entry["swat_key"], entry)
+        index_add(tag_index, entry["tag_key"], entry)
+    return swat_index, tag_index
+
+def fuzzy_key(name):
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return SEPARATOR_RE.sub("", CLAN_TAG_RE.sub("", name).translate(CONFUSABLES))
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class FuzzyMatcher:
+    """
+    Finds the most similar member name for players without an exact match. Names are normalized (fuzzy_key)
+    and split into trigrams; an inverted index from trigram to names limits the comparison to names sharing
+    trigrams, and only the FUZZY_MAX_CANDIDATES names sharing the most are scored (Dice coefficient); names
+    with other digits are never accepted. Only [SWAT] players are matched this way, untagged players are mostly
+    not members and would be matched to similar names of cadets. MEMBER_ALIASES are resolved first for both.
+    Holds only plain data, so it can be pickled.
+    """
+    def __init__(self, members, generation):
+        self.generation = generation
+        # Settings are copied, worker processes only see the configured values
+        self.fuzzy = FUZZY_MATCHING
+        self.threshold = FUZZY_THRESHOLD
+        self.max_candidates = FUZZY_MAX_CANDIDATES
+        self.aliases = {}
+        for name, member_id in MEMBER_ALIASES.items():
+            if member_id in members:
+                self.aliases[name.casefold()] = members[member_id]
+        # "swat": members with the SWAT or mentor role, for [SWAT] players
+        self.groups = {
+            "swat": self.build([e for e in members.values() if SWAT_ROLE_ID in e["roles"] or MENTOR_ROLE_ID in e["roles"]], "swat_key"),
+        }
+        self.results = {}  # (group, username) -> (entry, score) or None
+
+    @staticmethod
+    def build(entries, key_field):
+        by_key = {}
+        for entry in entries:
+            key = fuzzy_key(entry[key_field])
+            if key:
+                by_key.setdefault(key, []).append(entry)
+        names = list(by_key)
+        postings = {}
+        sizes = []
+        for i, name in enumerate(names):
+            grams = trigrams(name)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        return {
+            "postings": postings,
+            "sizes": sizes,
+            "digits": [DIGITS_RE.sub("", name) for name in names],
+            "entries": [sorted(by_key[name], key=lambda e: (e["rank_order"], e["id"])) for name in names],
+        }
+
+    def lookup(self, group_name, username):
+        cache_key = (group_name, username)
+        if cache_key in self.results:
+            return self.results[cache_key]
+        if len(self.results) >= 50_000:
+            self.results.clear()  # players come and go, keep the cache bounded
+        group = self.groups[group_name]
+        key = fuzzy_key(username)
+        grams = trigrams(key)
+        digits = DIGITS_RE.sub("", key)
+        shared = {}
+        for gram in grams:
+            for i in group["postings"].get(gram, ()):
+                if group["digits"][i] == digits:
+                    shared[i] = shared.get(i, 0) + 1
+        result = None
+        if shared:
+            candidates = heapq.nlargest(self.max_candidates, shared.items(), key=lambda item: item[1])
+            score, i = max((2 * count / (len(grams) + group["sizes"][i]), i) for i, count in candidates)
+            if score >= self.threshold:
+                result = group["entries"][i][0], score
+        self.results[cache_key] = result
+        return result
+
+fuzzy_matcher = None
+
+def get_fuzzy_matcher():
+    # Rebuilt whenever the member cache changed since the last build
+    global fuzzy_matcher
+    if fuzzy_matcher is None or fuzzy_matcher.generation != discord_cache["generation"]:
+        with metrics.timer("build_fuzzy_matcher"):
+            fuzzy_matcher = FuzzyMatcher(discord_cache["members"], discord_cache["generation"])
+    return fuzzy_matcher
+
+def match_players(players):
+    """
+    Matches the in-game player list against the Discord member indexes and returns the sorted SWAT list.
+    Players without an exact match are looked up in MEMBER_ALIASES and, with FUZZY_MATCHING, by similarity.
+    """
+    matcher = get_fuzzy_matcher() if FUZZY_MATCHING or MEMBER_ALIASES else None
+    usernames = [pl["Username"]["Username"] for pl in players]
+    matching_players, stats = match_usernames(usernames, discord_cache["swat_index"], discord_cache["tag_index"], matcher)
+    record_match_stats(stats)
+    return matching_players
+
+def match_usernames(usernames, swat_index, tag_index, matcher):
+    """
+    The matching itself. Only uses its arguments (and constants), so it can run in a worker process with a
+    copy of the indexes (see match_payload). Returns (sorted matching players, stats for record_match_stats).
+    """
+    stats = {"methods": {}, "fuzzy_hits": [], "lookups": 0, "lookup_seconds": 0.0}
+    methods = stats["methods"]  # (kind, method) -> count, for the hit rate
+    matching_players = []
+    seen = set()
+    for username in usernames:
+        if username in seen:
+            continue  # skip duplicates
+        seen.add(username)
+
+        # Check for [SWAT] tag in the player's name
+        if username.startswith("[SWAT] "):
+            entries = swat_index.get(SWAT_PREFIX_RE.sub('', username).casefold())
+            details = entries[0] if entries else None
+            method = "exact"
+            if not details and matcher:
+                details, method = resolve_unmatched(matcher, "swat", username, SWAT_PREFIX_RE.sub('', username), stats)
+            method = method if details else "none"
+            methods[("swat", method)] = methods.get(("swat", method), 0) + 1
+            if details:
+                # Prepend the icon if the member has the leadership role
+                matching_players.append({
+                    "username": f"{LEADERSHIP_EMOJI} {username}" if details["is_leader"] else username,
+                    "type": details["swat_type"],
+                    "discord_id": details["id"],
+                    "rank": details["rank"],
+                    "rank_order": details["rank_order"],
+                })
+            else:
+                matching_players.append({
+                    "username": username,
+                    "type": "SWAT",
+                    "discord_id": None,
+                    "rank": None,
+                    "rank_order": RANK_ORDER.get(None, len(RANK_HIERARCHY)),
+                })
+        else:
+            # see if they match a Cadet/Trainee user on Discord
+            entries = tag_index.get(username.casefold(), ())
+            details = next((e for e in entries if e["member_type"]), None)
+            method = "exact"
+            if not details and matcher:
+                details, method = resolve_unmatched(matcher, "tag", username, username, stats)
+            # Most untagged players are not members, a miss is only counted if aliases/fuzzy matching were tried
+            if details or matcher:
+                method = method if details else "none"
+                methods[("tag", method)] = methods.get(("tag", method), 0) + 1
+            if details:
+                matching_players.append({
+                    "username": username,
+                    "type": details["member_type"] or details["swat_type"],
+                    "discord_id": details["id"],
+                    "rank": details["rank"],
+                    "rank_order": details["rank_order"],
+                })
+
+    matching_players.sort(key=lambda x: x["rank_order"])
+    return matching_players, stats
+
+def resolve_unmatched(matcher, group, username, name, stats):
+    # Returns (member entry or None, method)
+    details = matcher.aliases.get(username.casefold()) or matcher.aliases.get(name.casefold())
+    if details:
+        return details, "alias"
+    if not matcher.fuzzy or group not in matcher.groups:
+        return None, "none"
+    if (group, name) in matcher.results:
+        result = matcher.results[(group, name)]
+    else:
+        start = time.perf_counter()
+        result = matcher.lookup(group, name)
+        stats["lookups"] += 1
+        stats["lookup_seconds"] += time.perf_counter() - start
+        if result:
+            stats["fuzzy_hits"].append((username, result[0]["name"], result[1]))
+    if not result:
+        return None, "none"
+    return result[0], "fuzzy"
+
+def record_match_stats(stats):
+    for (kind, method), count in stats["methods"].items():
+        metrics.inc("swat_match_total", count, kind=kind, method=method)
+    if stats["lookups"]:
+        metrics.inc("swat_fuzzy_lookups_total", stats["lookups"])
+        metrics.inc("swat_fuzzy_lookup_seconds_total", stats["lookup_seconds"])
+    for username, name, score in stats["fuzzy_hits"]:
+        log("info", f"Ähnlicher Name: {username} -> {name} ({score:.2f})", key="fuzzy_match")
+
+# Worker processes for EXECUTION_MODE = "process"
+MATCH_ENTRY_FIELDS = ("id", "name", "swat_type", "member_type", "rank", "rank_order", "is_leader")
+match_pool = None
+match_index_blob = {"version": None, "blob": None}
+match_worker_index = None  # in a worker process: (version, swat_index, tag_index, matcher)
+
+def get_match_pool():
+    global match_pool
+    if match_pool is None:
+        workers = EXECUTOR_WORKERS or min(len(API_URLS), os.cpu_count() or 1)
+        # spawn instead of fork: a forked copy of the bot's threads (logging, writers) could deadlock
+        match_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return match_pool
+
+def shutdown_match_pool():
+    global match_pool
+    if match_pool is not None:
+        match_pool.shutdown(wait=False, cancel_futures=True)
+        match_pool = None
+
+def compact_match_entry(entry):
+    return {field: entry[field] for field in MATCH_ENTRY_FIELDS}
+
+def get_match_index_blob():
+    """
+    Pickles what match_usernames reads from the member indexes (the first relevant entry per name, without
+    roles) once per cache version. Every task carries it; a worker only unpickles it when its copy is older.
+    Follows every change, as members without roles are in the index for the exact [SWAT] lookup.
+    """
+    version = discord_cache["version"]
+    if match_index_blob["version"] != version:
+        with metrics.timer("pickle_match_index"):
+            swat_index = {key: [compact_match_entry(entries[0])] for key, entries in discord_cache["swat_index"].items()}
+            tag_index = {}
+            for key, entries in discord_cache["tag_index"].items():
+                first = next((e for e in entries if e["member_type"]), None)
+                if first:
+                    tag_index[key] = [compact_match_entry(first)]
+            matcher = get_fuzzy_matcher() if FUZZY_MATCHING or MEMBER_ALIASES else None
+            blob = pickle.dumps((swat_index, tag_index, matcher), protocol=pickle.HIGHEST_PROTOCOL)
+        match_index_blob.update(version=version, blob=blob)
+        metrics.set("swat_match_index_bytes", len(blob))
+    return version, match_index_blob["blob"]
+
+def match_payload(raw, version, index_blob):
+    # Runs in a worker process: decodes a raw players payload, keeps only the names and matches them
+    global match_worker_index
+    if match_worker_index is None or match_worker_index[0] != version:
+        match_worker_index = (version, *pickle.loads(index_blob))
+    usernames = [pl["Username"]["Username"] for pl in json.loads(raw)]
+    return match_usernames(usernames, *match_worker_index[1:])
+
+async def match_region(region, players):
+    """
+    Raw payloads are decoded and matched in a worker process, lists (local JSON) on the loop.
+    Raises InvalidPayloadError if a raw payload is not a valid player list.
+    """
+    if isinstance(players, bytes):
+        version, blob = get_match_index_blob()
+        try:
+            matching_players, stats = await asyncio.get_running_loop().run_in_executor(
+                get_match_pool(), match_payload, players, version, blob)
+        except concurrent.futures.process.BrokenProcessPool as e:
+            log("error", f"Worker-Prozess abgestürzt, Region {region} wird im Bot abgeglichen: {e}", key="match_pool_broken", region=region)
+            shutdown_match_pool()
+            try:
+                return match_players(json.loads(players))
+            except (ValueError, KeyError, TypeError) as e:
+                raise InvalidPayloadError(e) from e
+        except (ValueError, KeyError, TypeError) as e:
+            raise InvalidPayloadError(e) from e
+        else:
+            record_match_stats(stats)
+            return matching_players
+    return match_players(players)
+
+def heartbeat_fresh(queue_data, region, as_of=None):
+    # A server whose last heartbeat is older than 10 minutes (before as_of, default now) counts as offline
+    try:
+        last_heartbeat = datetime.fromisoformat(
+            queue_data[region]["LastHeartbeatDateTime"].replace("Z", "+00:00")
+        )
+        now = as_of if as_of is not None else clock()
+        return datetime.fromtimestamp(now, pytz.UTC) - last_heartbeat <= timedelta(minutes=10)
+    except:
+        return True
+
+# Custom emojis from the server, resolved by resolve_emojis (if not found, default to circle)
+EMOJI_IDS = {
+    "mentor": 1305249069463113818,
+    "trainee": 1305496951642390579,
+    "cadet": 1305496985582698607,
+    "SWAT": 1196404423874854992,
+}
+# Discord embed limits
+EMBED_FIELD_LIMIT = 1024
+EMBED_TOTAL_LIMIT = 6000
+EMBED_MAX_FIELDS = 25
+LINE_CACHE_SIZE = 5000
+
+emoji_cache = {}  # type -> emoji string
+emoji_version = 0  # increments whenever the emojis are resolved again, part of the embed render key
+line_cache = {}  # (username, discord_id, type) -> formatted player line
+
+def resolve_emojis():
+    global emoji_version
+    for key, emoji_id in EMOJI_IDS.items():
+        emoji = client.get_emoji(emoji_id)
+        emoji_cache[key] = str(emoji if emoji else "⚫")
+    emoji_version += 1
+    line_cache.clear()
+
+def emoji(key):
+    return emoji_cache.get(key, "⚫")
+
+def player_line(mp):
+    cache_key = (mp["username"], mp["discord_id"], mp["type"])
+    line = line_cache.get(cache_key)
+    if line is None:
+        if mp["type"] in ("trainee", "cadet"):
+            line = f"\n{emoji(mp['type'])} {mp['username']} (<@{mp['discord_id']}>)"
+        elif mp["discord_id"]:
+            line = f"\n - {mp['username']} (<@{mp['discord_id']}>)"
+        else:
+            line = f"\n - {mp['username']} (❔)"
+        if len(line_cache) >= LINE_CACHE_SIZE:
+            line_cache.clear()
+        line_cache[cache_key] = line
+    return line
+
+def layout_player_fields(sections, char_budget, field_budget):
+    """
+    Lays out (name, lines) sections as embed fields within Discord's limits. A section is split into
+    several fields at EMBED_FIELD_LIMIT characters; lines that do not fit into char_budget or field_budget
+    anymore are left out and summarized in a last line. Returns a list of (name, value) tuples.
+    """
+    fields = []  # [name, lines, length]
+    omitted = 0
+    char_budget -= 32  # room for the summary line
+    for name, lines in sections:
+        current = None
+        for line in lines:
+            cost = len(line)
+            if current is None or current[2] + cost > EMBED_FIELD_LIMIT:
+                field_name = name if current is None else ""
+                if omitted or len(fields) >= field_budget or cost + len(field_name) > char_budget:
+                    omitted += 1
+                    continue
+                current = [field_name, [], 0]
+                fields.append(current)
+                char_budget -= len(field_name)
+            elif omitted or cost > char_budget:
+                omitted += 1
+                continue
+            current[1].append(line)
+            current[2] += cost
+            char_budget -= cost
+
+    if omitted and fields:
+        last = fields[-1]
+        more = f"\n*... and {omitted} more*"
+        while last[1] and last[2] + len(more) > EMBED_FIELD_LIMIT:
+            last[2] -= len(last[1].pop())
+            omitted += 1
+            more = f"\n*... and {omitted} more*"
+        last[1].append(more)
+    return [(name, "".join(lines)) for name, lines, _ in fields]
+
+async def create_embed(region, matching_players, queue_data, fivem_data, stale_since=None, as_of=None):
     offline = False
     embed_color = 0x28ef05  # default green
     
@@ -211,15 +1391,9 @@ async def create_embed(region, matching_players, queue_data, fivem_data):
         embed_color = 0xf40006  # red
 
     if queue_data and region in queue_data and not offline:
-        try:
-            last_heartbeat = datetime.fromisoformat(
-                queue_data[region]["LastHeartbeatDateTime"].replace("Z", "+00:00")
-            )
-            if datetime.now(pytz.UTC) - last_heartbeat > timedelta(minutes=10):
-                offline = True
-                embed_color = 0xf40006  # red
-        except:
-            pass
+        if not heartbeat_fresh(queue_data, region, as_of):
+            offline = True
+            embed_color = 0xf40006  # red
     else:
         offline = True
         embed_color = 0xf40006  # red
@@ -227,10 +1401,7 @@ async def create_embed(region, matching_players, queue_data, fivem_data):
     flags = {"EU": "🇪🇺 ", "NA": "🇺🇸 ", "SEA": "🇸🇬 "}
     region_name = region[:-1] if region[-1].isdigit() else region
     title = f"{flags.get(region_name, '')}{region}"
-    # Emojis from server (if not found, default to circle)
-    def safe_emoji(eid, default="⚫"):
-        e = client.get_emoji(eid)
-        return str(e if e else default)
+    footer = "Refreshes every 30 seconds"
 
     embed = discord.Embed(title=title, colour=embed_color)
     
@@ -242,260 +1413,1232 @@ async def create_embed(region, matching_players, queue_data, fivem_data):
         embed.timestamp = datetime.now()
         return embed
 
-    # Check if server offline / no data
-    if matching_players is not None and offline is not True:
-        swat_count = sum(p["type"] in ("unknown", "SWAT", "mentor") for p in matching_players)
-        mentor_count = sum(p["type"] == "mentor" for p in matching_players)
-        trainee_count = sum(p["type"] in ("trainee", "cadet") for p in matching_players)
-        
-        # Try to read FiveM "Time" for next restart
-        try:
-            restart_timer = time_convert(fivem_data[region]["vars"]["Time"])
-        except:
-            restart_timer = "*No restart data available!*"
-
-        # Mentor
-        if mentor_count:
-            val = ""
-            for mp in matching_players:
-                if mp["type"] == "mentor":
-                    val += f"\n - {mp['username']} (<@{mp['discord_id']}>)" if mp['discord_id'] else f"\n - {mp['username']} (❔)"
-            embed.add_field(name=f"{safe_emoji(1305249069463113818)}Mentors Online:", value=val, inline=False)
-
-        # SWAT
-        if swat_count - mentor_count > 0:
-            val = ""
-            for mp in matching_players:
-                if mp["type"] in ("SWAT", "unknown"):
-                    val += f"\n - {mp['username']} (<@{mp['discord_id']}>)" if mp['discord_id'] else f"\n - {mp['username']} (❔)"
-            embed.add_field(name="SWAT Online:", value=val, inline=False)
-
-        # Trainees / Cadets
-        if trainee_count:
-            val = ""
-            for mp in matching_players:
-                if mp["type"] == "trainee":
-                    val += f"\n{safe_emoji(1305496951642390579)} {mp['username']} (<@{mp['discord_id']}>)"
-                elif mp["type"] == "cadet":
-                    val += f"\n{safe_emoji(1305496985582698607)} {mp['username']} (<@{mp['discord_id']}>)"
-            embed.add_field(name="Cadets / Trainees Online:", value=val, inline=False)
-
-        if all(p["type"] not in ("SWAT","mentor","trainee","cadet","unknown") for p in matching_players):
-            embed.add_field(name="\n*Nobody is online*\n", value="", inline=False)
-
-        # Stats
-        if queue_data and region in queue_data:
-            p = queue_data[region]
-            embed.add_field(name=f"{safe_emoji(1196404423874854992)}SWAT:", value=f"``` {swat_count} + {trainee_count} ```", inline=True)
-            embed.add_field(name="🎮Players:", value=f"```{p['Players']}/{p['MaxPlayers']}```", inline=True)
-            embed.add_field(name="⌛Queue:", value=f"```{p['QueuedPlayers']}```", inline=True)
-            embed.add_field(name="", value=restart_timer, inline=False)
-        else:
-            embed.add_field(name=f"{safe_emoji(1196404423874854992)}SWAT:", value=f"``` {swat_count} + {trainee_count} ```", inline=True)
-            embed.add_field(name="🎮Players:", value="```no data```", inline=True)
-            embed.add_field(name="⌛Queue:", value="```no data```", inline=True)
+    # Some data is the last known good state of a failing endpoint
+    if stale_since:
+        embed.colour = 0xf4a300  # amber
+        embed.add_field(name="⚠️ Stale data", value=f"*Stale since <t:{int(stale_since)}:R>*", inline=False)
+
+    # One pass over the players: bucket their (cached) lines, the counts follow from the buckets
+    mentors, swat, trainees = [], [], []
+    for mp in matching_players:
+        player_type = mp["type"]
+        if player_type == "mentor":
+            mentors.append(player_line(mp))
+        elif player_type in ("SWAT", "unknown"):
+            swat.append(player_line(mp))
+        elif player_type in ("trainee", "cadet"):
+            trainees.append(player_line(mp))
+    swat_count = len(mentors) + len(swat)
+    trainee_count = len(trainees)
+
+    # Countdown to the next restart from the cached schedule
+    restart_timer = restart_countdown(fivem_data[region].get("restart_at") if fivem_data and fivem_data.get(region) else None)
+
+    # Fields below the player lists, they always have to fit
+    trailing = []
+    if not (mentors or swat or trainees):
+        trailing.append(("\n*Nobody is online*\n", "", False))
+    trailing.append((f"{emoji('SWAT')}SWAT:", f"``` {swat_count} + {trainee_count} ```", True))
+    if queue_data and region in queue_data:
+        p = queue_data[region]
+        trailing.append(("🎮Players:", f"```{p['Players']}/{p['MaxPlayers']}```", True))
+        trailing.append(("⌛Queue:", f"```{p['QueuedPlayers']}```", True))
+        trailing.append(("", restart_timer, False))
     else:
-        embed.add_field(name="Server or API down?", value="No Data for this server!", inline=False)
-        embed.add_field(name="🎮Players:", value="```no data```", inline=True)
-        embed.add_field(name="⌛Queue:", value="```no data```", inline=True)
+        trailing.append(("🎮Players:", "```no data```", True))
+        trailing.append(("⌛Queue:", "```no data```", True))
+
+    used = len(title) + len(footer) + sum(len(f.name) + len(f.value) for f in embed.fields)
+    used += sum(len(name) + len(value) for name, value, _ in trailing)
+    sections = []
+    if mentors:
+        sections.append((f"{emoji('mentor')}Mentors Online:", mentors))
+    if swat:
+        sections.append(("SWAT Online:", swat))
+    if trainees:
+        sections.append(("Cadets / Trainees Online:", trainees))
+    for name, value in layout_player_fields(sections, EMBED_TOTAL_LIMIT - used,
+                                            EMBED_MAX_FIELDS - len(embed.fields) - len(trailing)):
+        embed.add_field(name=name, value=value, inline=False)
+    for name, value, inline in trailing:
+        embed.add_field(name=name, value=value, inline=inline)
 
-    embed.set_footer(text="Refreshes every 30 seconds")
+    embed.set_footer(text=footer)
     embed.timestamp = datetime.now()
     return embed
 
-@tasks.loop(seconds=CHECK_INTERVAL)
-async def update_game_status():
-    # 1) Update the Discord cache first
+@tasks.loop(seconds=CACHE_REBUILD_INTERVAL)
+async def discord_cache_loop():
+    # The first iteration runs right away, but on_ready has just built the cache
+    if discord_cache_loop.current_loop == 0:
+        return
     await update_discord_cache()
-    
-    # 2) Retrieve queue_data and fivem_data first (these are single calls)
-    queue_data = await getqueuedata()
-    fivem_data = await get_fivem_data()
-    
-    # 3) Create tasks to fetch players data for each region
-    regions = list(API_URLS.keys())
-    results = []
-    for region in regions:
-        players = await fetch_players(region)  # Wait for each call
-        results.append(players)
-        await asyncio.sleep(1)  # 1-second pause between calls
-    
-    # 5) Store each region's 'players' result in a dict
-    region_players_map = dict(zip(regions, results))
 
-    embed_file_name = EMBEDS_FILE
-    channel = client.get_channel(STATUS_CHANNEL_ID)
-    if not channel: 
-        log("error", f"Status-Kanal {STATUS_CHANNEL_ID} nicht gefunden.")
+async def load_stored_embeds():
+    global stored_embeds
+    try:
+        content = await asyncio.to_thread(read_text_file, EMBEDS_FILE)
+    except FileNotFoundError:
+        return
+    if not content.strip():
         return
+    data = json.loads(content)
+    if isinstance(data, list):
+        # Flat list from before STATUS_TARGETS, every entry records the channel it was sent to
+        stored_embeds = {}
+        for em in data:
+            stored_embeds.setdefault(em.get("channel_id", STATUS_CHANNEL_ID), []).append(em)
+        log("info", f"{EMBEDS_FILE} auf Nachrichten pro Kanal umgestellt.")
+    else:
+        # JSON object keys are strings
+        stored_embeds = {int(channel_id): messages for channel_id, messages in data.items()}
+
+async def save_stored_embeds():
+    # Serialized on the loop (consistent snapshot), written in a thread; the lock keeps writes in order
+    content = json.dumps(stored_embeds)
+    async with stored_embeds_lock:
+        await asyncio.to_thread(write_text_file, EMBEDS_FILE, content)
+
+def write_snapshot_file(path, snapshot):
+    # Compact gzip'ed JSON, written atomically like write_text_file
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as file:
+        json.dump(snapshot, file, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def read_snapshot_file(path):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        return json.load(file)
+
+@tasks.loop(seconds=SNAPSHOT_INTERVAL)
+async def save_snapshot():
+    """
+    Persists the Discord member cache and the last inputs of every region, so a restarted bot can publish
+    right away (see warm_start). The embed fingerprints are already persisted in EMBEDS_FILE.
+    """
+    if discord_cache["timestamp"] is None:
+        return
+    # Collected on the loop; the entries are replaced on change, never modified, so the thread can serialize them
+    snapshot = {
+        "saved_at": time.time(),
+        "members": [(e["id"], e["name"], e["roles"]) for e in discord_cache["members"].values()],
+        "regions": {r: state["snapshot"] for r, state in region_state.items() if "snapshot" in state},
+    }
+    try:
+        with metrics.timer("save_snapshot"):
+            await asyncio.to_thread(write_snapshot_file, SNAPSHOT_FILE, snapshot)
+    except OSError as e:
+        log("warning", f"Snapshot konnte nicht gespeichert werden: {e}")
 
-    # If we have an existing file with stored embeds, read it once here
-    stored_embeds = []
-    if os.path.exists(embed_file_name) and os.path.getsize(embed_file_name) > 0:
-        with open(embed_file_name, "r") as f:
-            stored_embeds = json.load(f)
-
-    # For each region, we now have data in region_players_map[region]
-    for region in regions:
-        log("info", f"Verarbeite Region: {region}")
-        
-        players = region_players_map[region]  # Could be None, list, or an Exception
+async def warm_start():
+    """
+    Loads the snapshot written by save_snapshot and publishes every region from it with a staleness marker,
+    before the gateway is ready. The regular updates replace these embeds once fresh data is in.
+    """
+    start = time.perf_counter()
+    try:
+        snapshot = await asyncio.to_thread(read_snapshot_file, SNAPSHOT_FILE)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError, EOFError) as e:
+        log("warning", f"Snapshot konnte nicht geladen werden: {e}")
+        return
+    age = time.time() - snapshot["saved_at"]
+    if age > SNAPSHOT_MAX_AGE:
+        log("info", f"Snapshot ist zu alt ({age:.0f}s), Kaltstart.")
+        return
+
+    # The next full rebuild reports what changed meanwhile
+    if discord_cache["timestamp"] is None:
+        restore_member_cache(snapshot["members"], datetime.fromtimestamp(snapshot["saved_at"]))
+
+    # Gateway is not ready yet, status_channel only needs the channel ids for the REST calls
+    embeds = {}
+    for region, snap in snapshot["regions"].items():
+        if region not in API_URLS or "embed" in region_state.get(region, {}):
+            continue
+        # A region restored by an earlier warm start keeps the time of its last update
+        updated_at = snap.get("updated_at", snapshot["saved_at"])
+        if time.time() - updated_at > SNAPSHOT_MAX_AGE:
+            continue
+        queue_data = {region: snap["queue"]} if snap["queue"] else None
+        # The heartbeat is judged at the time of the snapshot, the stale marker shows its age
+        embed = await create_embed(region, snap["players"], queue_data, {region: snap["fivem"]}, updated_at,
+                                   as_of=updated_at)
+        state = region_state.setdefault(region, {"hits": 0, "misses": 0})
+        state["embed"] = embed
+        # Kept until the region is updated, so a snapshot saved before that does not lose the region
+        state["snapshot"] = snap
+        embeds[region] = embed
+    if SINGLE_MESSAGE_MODE:
+        await publish_single_message()
+    else:
+        await asyncio.gather(*(publish_region(region, embed) for region, embed in embeds.items()))
+        await save_stored_embeds()
+    log("info", f"Warmstart aus Snapshot (Alter {age:.0f}s) in {(time.perf_counter() - start) * 1000:.0f} ms veröffentlicht.")
+
+@timed("update_region")
+async def update_region(region, publish=True):
+    """
+    Fetches, matches, renders and publishes one region.
+    Returns (matching_players, queue entry) for the scheduler.
+    """
+    queue_data, fivem, (players, players_changed) = await asyncio.gather(
+        get_queue_data(),
+        get_fivem_data(region),
+        fetch_players(region),
+    )
+    fivem_data = {region: fivem}
+    state = region_state.setdefault(region, {"hits": 0, "misses": 0})
+
+    # Unchanged player list and Discord cache => reuse the last matching result
+    matching_key = (endpoint_digest(f"players:{region}"), discord_cache["generation"])
+    if not players_changed and players and state.get("matching_key") == matching_key:
+        matching_players = state["matching_players"]
+        state["hits"] += 1
+        metrics.inc("swat_snapshot_cache_total", region=region, result="hit")
+    else:
         matching_players = [] if players else None
-        # If it's an actual list, we proceed to build the matching_players array:
-        if isinstance(players, list):
-            matching_players = []
-            for pl in players:
-                username = pl["Username"]["Username"]
-                if any(mp["username"] == username for mp in matching_players):
-                    continue  # skip duplicates in matching_players
-
-                # Check for [SWAT] tag in the player's name
-                if username.startswith("[SWAT] "):
-                    cleaned_name = re.sub(r'^\[SWAT\]\s*', '', username, flags=re.IGNORECASE)
-                    discord_found = False
-                    for discord_name, details in discord_cache["members"].items():
-                        compare_dn = re.sub(r'\s*\[SWAT\]$', '', discord_name, flags=re.IGNORECASE)
-                        if cleaned_name.lower() == compare_dn.lower():
-                            discord_found = True
-                            # Check if the member has the leadership role and prepend the icon if so.
-                            is_leader = LEADERSHIP_ROLE_ID in details["roles"]
-                            display_name = f"{LEADERSHIP_EMOJI} {username}" if is_leader else username
-                            mtype = "mentor" if MENTOR_ROLE_ID in details["roles"] else "SWAT"
-                            matching_players.append({
-                                "username": display_name,
-                                "type": mtype,
-                                "discord_id": details["id"],
-                                "rank": get_rank_from_roles(details["roles"])
-                            })
-                            break
-                    if not discord_found:
-                        matching_players.append({
-                            "username": username,
-                            "type": "SWAT",
-                            "discord_id": None,
-                            "rank": None
-                        })
-                else:
-                    # see if they match a Cadet/Trainee/SWAT user on Discord
-                    for discord_name, details in discord_cache["members"].items():
-                        # Strip out trailing "[CADET]", "[TRAINEE]", "[SWAT]" from the Discord nickname
-                        tmp_dn = re.sub(r'\s*\[(CADET|TRAINEE|SWAT)\]$', '', discord_name, flags=re.IGNORECASE)
-                        if username.lower() == tmp_dn.lower():
-                            if CADET_ROLE_ID in details["roles"]:
-                                matching_players.append({
-                                    "username": username,
-                                    "type": "cadet",
-                                    "discord_id": details["id"],
-                                    "rank": get_rank_from_roles(details["roles"])
-                                })
-                            elif TRAINEE_ROLE_ID in details["roles"]:
-                                matching_players.append({
-                                    "username": username,
-                                    "type": "trainee",
-                                    "discord_id": details["id"],
-                                    "rank": get_rank_from_roles(details["roles"])
-                                })
-                            """
-                            elif SWAT_ROLE_ID in details["roles"]:
-                                matching_players.append({
-                                    "username": username,
-                                    "type": "SWAT",
-                                    "discord_id": details["id"],
-                                    "rank": get_rank_from_roles(details["roles"])
-                                })
-                            """
-                            break
-        
-        # Sort matching players if not None
-        if matching_players is not None:
-            matching_players.sort(
-                key=lambda x: RANK_HIERARCHY.index(x["rank"]) 
-                    if x["rank"] in RANK_HIERARCHY else len(RANK_HIERARCHY)
-            )
-
-        # Create the new embed
-        embed_pre = await create_embed(region, matching_players, queue_data, fivem_data)
-
-        # --- Now, update or create the embed for that region ---
-        await asyncio.sleep(1)
-        await update_or_create_embed_for_region(channel, region, embed_pre, stored_embeds)
-
-    # After all regions are processed, rewrite the stored_embeds file
-    with open(embed_file_name, "w") as f:
-        json.dump(stored_embeds, f)
-
-
-async def update_or_create_embed_for_region(channel, region, embed_pre, stored_embeds):
-    """
-    Updates an existing embed message for the given region, or creates a new one.
-    """
-    # 1) Check if we already have an entry for this region
-    found_existing = False
-    for em in stored_embeds:
-        if em["region"] == region:
-            found_existing = True
-            # Attempt to edit
-            MAX_RETRIES = 3
-            for attempt in range(1, MAX_RETRIES+1):
+        # If it's an actual list (or the raw payload of one), we match it against the Discord member indexes
+        if isinstance(players, (list, bytes)):
+            with metrics.timer("match_players", region=region):
                 try:
-                    msg = await channel.fetch_message(em["message_id"])
-                    await msg.edit(embed=embed_pre)
-                    await asyncio.sleep(1)
-                    break  # success => break out of the retry loop
-                except discord.HTTPException as e:
-                    if e.status == 503:
-                        log("warning", f"Discord 503 on attempt {attempt}, region={region}: {e}")
-                        if attempt == MAX_RETRIES:
-                            log("critical", f"Max retries for region={region}, message edit failed!")
-                            send_telegram(f"CRITICAL: Discord 503 - message edit failed for region={region}")
-                        else:
-                            await asyncio.sleep(5)  # Wait 5s, then retry
-                    else:
-                        log("error", f"Discord HTTPException: {e}")
-                        send_telegram(f"ERROR: Discord message edit failed: {e}")
-                        break
-                except Exception as ex:
-                    log("error", f"Unexpected error in msg.edit: {ex}")
-                    break
-            # After we handle editing, break out of stored_embeds loop
+                    matching_players = await match_region(region, players)
+                    confirm_response(f"players:{region}")
+                except InvalidPayloadError as e:
+                    # Only found out after decoding in the worker: served like a failed request
+                    metrics.inc("swat_fetch_errors_total", endpoint="players", region=region, reason="decode")
+                    log("error", f"Spielerliste von Region {region} ungültig: {e}", key=f"players_error:{region}", region=region, stage="match_players")
+                    players = reject_response(f"players:{region}")
+                    matching_players = await match_region(region, players) if players else None
+                    matching_key = (endpoint_digest(f"players:{region}"), discord_cache["generation"])
+        state["matching_key"] = matching_key if players else None
+        state["matching_players"] = matching_players
+        state["misses"] += 1
+        metrics.inc("swat_snapshot_cache_total", region=region, result="miss")
+    track_presence(region, matching_players)
+    update_player_index(region, matching_players)
+    stale = [t for t in (stale_since(f"players:{region}"), stale_since("servers"), stale_since(f"fivem_probe:{region}")) if t]
+    data_stale_since = min(stale) if stale else None
+    log("info", f"Verarbeite Region: {region}", key=f"update_region:{region}", region=region, stage="update_region",
+        unchanged=state["hits"], recomputed=state["misses"])
+
+    # Reuse the last embed if none of its inputs changed either
+    render_key = (
+        state["misses"],  # changes whenever the matching was recomputed
+        endpoint_digest("servers") if queue_data else None,
+        fivem["restart_at"] if fivem is not None else None,
+        heartbeat_fresh(queue_data, region) if queue_data else None,
+        data_stale_since,
+        emoji_version,
+    )
+    if state.get("render_key") == render_key:
+        embed_pre = state["embed"]
+        metrics.inc("swat_embed_cache_total", region=region, result="hit")
+    else:
+        with metrics.timer("create_embed", region=region):
+            embed_pre = await create_embed(region, matching_players, queue_data, fivem_data, data_stale_since)
+        state["render_key"] = render_key
+        state["embed"] = embed_pre
+        metrics.inc("swat_embed_cache_total", region=region, result="miss")
+
+    # --- Now, update or create the embed for that region in every target channel ---
+    if SINGLE_MESSAGE_MODE:
+        if publish:
+            schedule_single_message_publish()
+    else:
+        with metrics.timer("publish_region", region=region):
+            embeds_changed = await publish_region(region, embed_pre)
+        if embeds_changed:
+            await save_stored_embeds()
+
+    queue_entry = queue_data.get(region) if queue_data else None
+    # Inputs of this embed for save_snapshot
+    state["snapshot"] = {
+        "players": matching_players,
+        "queue": queue_entry,
+        "fivem": fivem,
+        "updated_at": time.time(),
+    }
+    return matching_players, queue_entry
+
+async def update_game_status():
+    # One update of every region at once, outside of the scheduler
+    if discord_cache["timestamp"] is None:
+        await update_discord_cache()
+    await asyncio.gather(*(update_region(region, publish=False) for region in API_URLS))
+    if SINGLE_MESSAGE_MODE:
+        await publish_single_message()
+
+class Supervisor:
+    """
+    Owns the long running tasks. A task that fails is restarted with exponential backoff, keeping all
+    in-memory state; task loops that stopped with an error are started again. Only after
+    SUPERVISOR_MAX_FAILURES failures within SUPERVISOR_FAILURE_WINDOW does the bot shut down.
+    """
+    def __init__(self):
+        self.tasks = set()
+        self.loops = {}  # name -> tasks.Loop
+        self.failures = []
+        self.exit_code = 0
+
+    def spawn(self, name, factory):
+        task = asyncio.create_task(self.supervise(name, factory), name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def watch(self, name, loop):
+        self.loops[name] = loop
+
+    def start(self):
+        self.spawn("supervisor-loops", self.check_loops)
+
+    def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def supervise(self, name, factory):
+        delay = SUPERVISOR_BACKOFF_BASE
+        while True:
+            started = time.monotonic()
+            try:
+                await factory()
+                return
+            except Exception as e:
+                log("error", f"Task {name} abgestürzt: {e}\n{traceback.format_exc()}", key=f"task_failed:{name}", task=name)
+                metrics.inc("swat_task_restarts_total", task=name)
+                if self.record_failure(f"Task {name}"):
+                    return
+            # A task that ran fine for a while starts over with the short backoff
+            if time.monotonic() - started > SUPERVISOR_BACKOFF_MAX:
+                delay = SUPERVISOR_BACKOFF_BASE
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, SUPERVISOR_BACKOFF_MAX)
+
+    async def check_loops(self):
+        while True:
+            await asyncio.sleep(30)
+            for name, loop in self.loops.items():
+                if loop.failed() or not loop.is_running():
+                    log("error", f"Task-Loop {name} läuft nicht mehr, wird neu gestartet.", key=f"task_failed:{name}", task=name)
+                    metrics.inc("swat_task_restarts_total", task=name)
+                    if self.record_failure(f"Task-Loop {name}"):
+                        return
+                    loop.cancel()
+                    loop.start()
+
+    def record_failure(self, source):
+        # Returns True when the failures are considered unrecoverable and the bot is shutting down
+        now = time.monotonic()
+        self.failures = [t for t in self.failures if now - t < SUPERVISOR_FAILURE_WINDOW]
+        self.failures.append(now)
+        metrics.inc("swat_failures_total")
+        if len(self.failures) < SUPERVISOR_MAX_FAILURES or self.exit_code:
+            return False
+        log("critical", f"{len(self.failures)} Fehler in {SUPERVISOR_FAILURE_WINDOW}s (zuletzt: {source}), Bot wird beendet.")
+        self.exit_code = 1
+        asyncio.get_running_loop().create_task(client.close())
+        return True
+
+supervisor = Supervisor()
+
+class RegionScheduler:
+    """
+    Runs an independent update loop per region. Each region polls faster while its SWAT roster or queue
+    changes and backs off while it is offline or stable. Ticks that fall due while a region is still busy
+    are coalesced into one.
+    """
+    def __init__(self, regions):
+        self.regions = regions
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REGION_UPDATES)
+        self.tasks = {}
+        self.intervals = {region: CHECK_INTERVAL for region in regions}
+        self.stable_ticks = {region: 0 for region in regions}
+        self.skipped_ticks = {region: 0 for region in regions}
+        self.last_seen = {region: None for region in regions}
+
+    def start(self):
+        for region in self.regions:
+            self.tasks[region] = supervisor.spawn(f"region-{region}", functools.partial(self.run_region, region))
+
+    def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+    async def run_region(self, region):
+        next_run = time.monotonic()
+        while True:
+            result = None
+            async with self.semaphore:
+                started = time.monotonic()
+                try:
+                    result = await self.run_with_deadline(region)
+                except Exception as e:
+                    log("error", f"Fehler beim Aktualisieren von Region {region}: {e}", key=f"update_error:{region}", region=region, stage="update_region")
+                duration = time.monotonic() - started
+
+            if duration > self.intervals[region]:
+                metrics.inc("swat_loop_overruns_total", region=region)
+                log("warning", f"Region {region}: Update dauerte {duration:.1f}s, länger als das Intervall "
+                    f"({self.intervals[region]:.0f}s).", key=f"overrun:{region}", region=region)
+            interval = self.next_interval(region, result)
+            self.intervals[region] = interval
+            metrics.set("swat_poll_interval_seconds", interval, region=region)
+            next_run += interval
+            now = time.monotonic()
+            if now > next_run:
+                # Still busy when the next tick(s) were due => run once now instead of catching up
+                skipped = int((now - next_run) // interval) + 1
+                self.skipped_ticks[region] += skipped
+                metrics.inc("swat_skipped_ticks_total", skipped, region=region)
+                next_run = now
+            await asyncio.sleep(next_run - now)
+
+    async def run_with_deadline(self, region):
+        # Watchdog: a cycle that runs past REGION_UPDATE_TIMEOUT is cancelled and its current stages reported
+        task = asyncio.create_task(update_region(region), name=f"update-{region}")
+        done, _ = await asyncio.wait({task}, timeout=REGION_UPDATE_TIMEOUT)
+        if done:
+            return task.result()
+        now = time.perf_counter()
+        stuck = sorted(metrics.active.get(region, {}).items(), key=lambda item: item[1])
+        stages = " > ".join(f"{stage} ({now - start:.1f}s)" for stage, start in stuck) or "unbekannt"
+        task.cancel()
+        metrics.inc("swat_watchdog_timeouts_total", region=region, stage=stuck[-1][0] if stuck else "unknown")
+        log("error", f"Region {region} hängt seit {REGION_UPDATE_TIMEOUT}s, abgebrochen in: {stages}",
+            key=f"watchdog:{region}", region=region, stage=stuck[-1][0] if stuck else None)
+        return None
+
+    def next_interval(self, region, result):
+        interval = self.intervals[region]
+        matching_players, queue_entry = result if result else (None, None)
+        if matching_players is None:
+            # Offline or failing => back off
+            self.last_seen[region] = None
+            self.stable_ticks[region] = 0
+            return min(interval * POLL_BACKOFF_FACTOR, POLL_INTERVAL_MAX)
+
+        roster = frozenset(mp["username"] for mp in matching_players)
+        queued = queue_entry.get("QueuedPlayers") if queue_entry else None
+        previous = self.last_seen[region]
+        self.last_seen[region] = (roster, queued)
+        if previous is not None and (previous[0] != roster or (queued and queued != previous[1])):
+            # SWAT joined/left or the queue is moving => poll faster
+            self.stable_ticks[region] = 0
+            return POLL_INTERVAL_MIN
+
+        self.stable_ticks[region] += 1
+        if self.stable_ticks[region] >= POLL_STABLE_TICKS:
+            return min(interval * POLL_BACKOFF_FACTOR, POLL_INTERVAL_MAX)
+        return interval
+
+
+def embed_fingerprint(embeds):
+    # Hash of the rendered embeds without their timestamps, which change on every render
+    data = [embed.to_dict() for embed in embeds]
+    for item in data:
+        item.pop("timestamp", None)
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def status_channel(channel_id):
+    # Publishing only needs the channel id for the REST calls, so targets work before the gateway is ready
+    return client.get_partial_messageable(channel_id)
+
+def stored_messages(channel_id):
+    # Stored messages (region/part, message id, fingerprint) of one target channel
+    return stored_embeds.setdefault(channel_id, [])
+
+async def discord_request(channel_id, key, method, request):
+    """
+    Runs one Discord REST call for a status message. Message sends and edits are rate limited per channel,
+    so the calls of one channel share a semaphore, while different channels run in parallel; discord.py
+    waits out 429s itself. 5xx responses and connection errors are retried with exponential backoff.
+    Raises discord.NotFound, other failures are reported and return None.
+    """
+    semaphore = channel_semaphores.get(channel_id)
+    if semaphore is None:
+        semaphore = channel_semaphores[channel_id] = asyncio.Semaphore(DISCORD_CHANNEL_CONCURRENCY)
+    delay = DISCORD_RETRY_DELAY
+    for attempt in range(1, DISCORD_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                metrics.inc("swat_discord_requests_total", method=method)
+                return await request()
+        except discord.NotFound:
+            raise
+        except discord.HTTPException as e:
+            if e.status < 500:
+                log("error", f"Discord HTTPException: {e}", key=f"discord_error:{channel_id}:{key}", region=key,
+                    stage="publish", channel=channel_id)
+                send_telegram(f"ERROR: Discord message {method} failed in channel {channel_id}: {e}")
+                return None
+            error = f"Discord {e}"
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            error = f"Discord {type(e).__name__}: {e}"
+        except Exception as ex:
+            log("error", f"Unexpected error in message {method}: {ex}", key=f"{method}_error:{channel_id}:{key}",
+                region=key, stage="publish", channel=channel_id)
+            return None
+        if attempt == DISCORD_MAX_RETRIES:
             break
+        log("warning", f"{error} on attempt {attempt}", key=f"discord_retry:{channel_id}:{key}", region=key,
+            stage="publish", channel=channel_id)
+        metrics.inc("swat_discord_retries_total", method=method)
+        await asyncio.sleep(delay)
+        delay *= 2
+    log("critical", f"Max retries, message {method} failed!", key=f"discord_{method}_failed:{channel_id}:{key}",
+        region=key, stage="publish", channel=channel_id)
+    send_telegram(f"CRITICAL: {error} - message {method} failed for region={key} in channel {channel_id}")
+    return None
+
+async def publish_region(region, embed):
+    """
+    Publishes the region's embed to every channel in STATUS_TARGETS at once. The embed is rendered once
+    for all targets. Returns True if stored_embeds was changed.
+    """
+    fingerprint = embed_fingerprint([embed])
+    results = await asyncio.gather(*(
+        update_or_create_message(status_channel(channel_id), region, [embed], fingerprint)
+        for channel_id in STATUS_TARGETS
+    ))
+    return any(results)
+
+async def update_or_create_message(channel, key, embeds, fingerprint):
+    """
+    Updates the stored message for key (a region, or a part of the single message) in the channel with the
+    embeds, or creates a new one. The edit is skipped if the content did not change and the message is not
+    older than EMBED_MAX_STALENESS. Returns True if stored_embeds was changed.
+    """
+    stored = stored_messages(channel.id)
+    now = time.time()
+
+    # 1) Check if we already have an entry for this key
+    em = next((em for em in stored if em["region"] == key), None)
+    if em:
+        if em.get("fingerprint") == fingerprint and now - em.get("published_at", 0) < EMBED_MAX_STALENESS:
+            metrics.inc("swat_embed_edits_skipped_total", region=key)
+            return False
+        # Attempt to edit, without fetching the message first
+        for embed in embeds:
+            embed.timestamp = datetime.now()
+        msg = channel.get_partial_message(em["message_id"])
+        try:
+            if await discord_request(channel.id, key, "edit", lambda: msg.edit(embeds=embeds)) is None:
+                return False
+            em["fingerprint"] = fingerprint
+            em["published_at"] = now
+            return True
+        except discord.NotFound:
+            # Message was deleted => forget it and send a new one below
+            log("warning", f"Nachricht für Region {key} in Kanal {channel.id} nicht gefunden, sende neu.",
+                region=key, stage="publish", channel=channel.id)
+            stored.remove(em)
+
+    # 2) If we do not have an entry for this key => create a new message
+    try:
+        msg_send = await discord_request(channel.id, key, "send", lambda: channel.send(embeds=embeds))
+    except discord.NotFound:
+        log("error", f"Status-Kanal {channel.id} nicht gefunden.", key=f"channel_missing:{channel.id}",
+            stage="publish", channel=channel.id)
+        msg_send = None
+    if msg_send is None:
+        # stored_embeds may have lost a deleted message above
+        return em is not None
+    stored.append({
+        "region": key,
+        "channel_id": channel.id,
+        "message_id": msg_send.id,
+        "fingerprint": fingerprint,
+        "published_at": now,
+    })
+    return True
+
+# --- Single message mode ---
+def single_message_key(part):
+    return f"{SINGLE_MESSAGE_KEY}:{part}"
+
+def is_single_message_key(key):
+    return key.startswith(f"{SINGLE_MESSAGE_KEY}:")
+
+def group_embeds(embeds):
+    # Discord allows 10 embeds and 6000 characters over all embeds of one message
+    groups, current, size = [], [], 0
+    for embed in embeds:
+        if current and (len(current) == 10 or size + len(embed) > 6000):
+            groups.append(current)
+            current, size = [], 0
+        current.append(embed)
+        size += len(embed)
+    if current:
+        groups.append(current)
+    return groups
+
+async def publish_single_message():
+    """
+    Publishes the latest embed of every region in one message (more if the embeds exceed Discord's limits)
+    to every channel in STATUS_TARGETS.
+    """
+    embeds = [region_state[r]["embed"] for r in API_URLS if "embed" in region_state.get(r, {})]
+    parts = [(single_message_key(part), group, embed_fingerprint(group))
+             for part, group in enumerate(group_embeds(embeds), start=1)]
+    with metrics.timer("publish_single_message"):
+        results = await asyncio.gather(*(
+            publish_single_message_parts(status_channel(channel_id), parts) for channel_id in STATUS_TARGETS
+        ))
+    if any(results):
+        await save_stored_embeds()
+
+async def publish_single_message_parts(channel, parts):
+    # The parts of one channel are published in order, so new parts are sent below the existing ones
+    changed = False
+    for key, group, fingerprint in parts:
+        if await update_or_create_message(channel, key, group, fingerprint):
+            changed = True
+    # Remove parts that are no longer needed
+    for em in [em for em in stored_messages(channel.id) if is_single_message_key(em["region"])]:
+        if int(em["region"].rsplit(":", 1)[1]) > len(parts):
+            await delete_stored_message(channel, em)
+            changed = True
+    return changed
+
+def schedule_single_message_publish():
+    # Region updates that arrive within SINGLE_MESSAGE_DELAY are published together in one edit
+    single_message_state["dirty"] = True
+    task = single_message_state["task"]
+    if task is None or task.done():
+        single_message_state["task"] = asyncio.create_task(run_single_message_publish())
 
-    # 2) If we did not find an existing entry for this region => create a new message
-    if not found_existing:
-        MAX_RETRIES = 3
-        for attempt in range(1, MAX_RETRIES+1):
+async def run_single_message_publish():
+    while single_message_state["dirty"]:
+        await asyncio.sleep(SINGLE_MESSAGE_DELAY)
+        single_message_state["dirty"] = False
+        await publish_single_message()
+
+async def delete_stored_message(channel, em):
+    stored_messages(channel.id).remove(em)
+    msg = channel.get_partial_message(em["message_id"])
+    try:
+        await discord_request(channel.id, em["region"], "delete", msg.delete)
+    except discord.NotFound:
+        pass
+
+async def migrate_stored_embeds():
+    """
+    Converts the stored messages of every target between the per-region layout and the single message
+    layout. The first existing message is reused for the new layout, the others are deleted.
+    """
+    changed = False
+    for channel_id in STATUS_TARGETS:
+        if await migrate_channel_layout(status_channel(channel_id)):
+            changed = True
+    if changed:
+        await save_stored_embeds()
+        log("info", f"{EMBEDS_FILE} auf {'eine Nachricht' if SINGLE_MESSAGE_MODE else 'eine Nachricht pro Region'} umgestellt.")
+
+async def migrate_channel_layout(channel):
+    stored = stored_messages(channel.id)
+    if SINGLE_MESSAGE_MODE:
+        old = [em for em in stored if not is_single_message_key(em["region"])]
+        if not old or any(is_single_message_key(em["region"]) for em in stored):
+            return False
+        keep = old[0]
+        keep.update({"region": single_message_key(1), "fingerprint": None})
+        old = old[1:]
+    else:
+        old = [em for em in stored if is_single_message_key(em["region"])]
+        if not old:
+            return False
+        first_region = next((r for r in API_URLS if not any(em["region"] == r for em in stored)), None)
+        if first_region:
+            keep = min(old, key=lambda em: em["region"])
+            keep.update({"region": first_region, "fingerprint": None})
+            old.remove(keep)
+    for em in old:
+        await delete_stored_message(channel, em)
+    return True
+
+class LoopBlockDetector(threading.Thread):
+    """
+    Watchdog thread that pings the event loop and reports the loop thread's stack when a ping is not
+    answered within the threshold, i.e. when a callback holds the loop for too long.
+    """
+    def __init__(self, loop, threshold, interval=0.1):
+        super().__init__(name="loop-block-detector", daemon=True)
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.loop_thread_id = threading.get_ident()  # created on the loop thread
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            answered = threading.Event()
+            start = time.perf_counter()
             try:
-                msg_send = await channel.send(embed=embed_pre)
-                stored_embeds.append({
-                    "region": region, 
-                    "channel_id": msg_send.channel.id, 
-                    "message_id": msg_send.id
-                })
-                await asyncio.sleep(1)
+                self.loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return  # loop closed
+            if answered.wait(self.threshold):
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=6)) if frame else ""
+            while not answered.wait(1) and not self.stopped.is_set():
+                pass
+            blocked = time.perf_counter() - start
+            try:
+                self.loop.call_soon_threadsafe(report_loop_block, blocked, stack)
+            except RuntimeError:
+                return
+
+def report_loop_block(blocked, stack):
+    metrics.inc("swat_event_loop_blocked_total")
+    metrics.observe("swat_event_loop_blocked_seconds", blocked)
+    log("warning", f"Event-Loop war mindestens {blocked * 1000:.0f} ms blockiert:\n{stack}", key="loop_block")
+
+def start_loop_block_detector():
+    global loop_block_detector
+    loop_block_detector = LoopBlockDetector(asyncio.get_running_loop(), LOOP_BLOCK_THRESHOLD)
+    loop_block_detector.start()
+
+class CaptureWriter(threading.Thread):
+    """
+    Writes captured API responses and Discord member changes as gzip'ed JSONL segments to CAPTURE_DIR, off the
+    event loop. A segment is rotated after CAPTURE_SEGMENT_BYTES (compressed) and starts with the latest member
+    snapshot, so each one can be replayed on its own (see replay.py). Only CAPTURE_MAX_SEGMENTS are kept.
+    """
+    def __init__(self):
+        super().__init__(name="capture-writer", daemon=True)
+        self.records = queue.Queue(maxsize=10000)
+        self.members = None
+        self.raw = None
+        self.file = None
+
+    def record(self, record_type, **fields):
+        fields["type"] = record_type
+        fields["t"] = time.time()
+        try:
+            self.records.put_nowait(fields)
+        except queue.Full:
+            metrics.inc("swat_capture_dropped_total")
+
+    def stop(self):
+        try:
+            self.records.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self.join(timeout=5)
+
+    def run(self):
+        os.makedirs(CAPTURE_DIR, exist_ok=True)
+        while True:
+            record = self.records.get()
+            if record is None:
                 break
-            except discord.HTTPException as e:
-                if e.status == 503:
-                    log("warning", f"Discord 503 on attempt {attempt}, region={region}: {e}")
-                    if attempt == MAX_RETRIES:
-                        log("critical", f"Max retries for region={region}, message sending failed!")
-                        send_telegram(f"CRITICAL: Discord 503 - message sending failed for region={region}")
-                    else:
-                        await asyncio.sleep(5)
-                else:
-                    log("error", f"Discord HTTPException: {e}")
-                    send_telegram(f"ERROR: Discord message sending failed: {e}")
+            try:
+                if record["type"] == "members":
+                    self.members = record
+                if self.file is None or self.raw.tell() >= CAPTURE_SEGMENT_BYTES:
+                    self.rotate()
+                    if self.members is not None and record is not self.members:
+                        self.write(self.members)
+                self.write(record)
+            except OSError as e:
+                logger.warning(f"Capture konnte nicht geschrieben werden: {e}")
+        self.close_segment()
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        metrics.inc("swat_capture_records_total", type=record["type"])
+
+    def rotate(self):
+        self.close_segment()
+        path = os.path.join(CAPTURE_DIR, datetime.now().strftime("capture-%Y%m%d-%H%M%S-%f.jsonl.gz"))
+        self.raw = open(path, "wb")
+        self.file = gzip.open(self.raw, "wt", encoding="utf-8")
+        segments = sorted(f for f in os.listdir(CAPTURE_DIR) if f.startswith("capture-") and f.endswith(".jsonl.gz"))
+        for name in segments[:-CAPTURE_MAX_SEGMENTS]:
+            os.remove(os.path.join(CAPTURE_DIR, name))
+
+    def close_segment(self):
+        if self.file is not None:
+            self.file.close()
+            self.raw.close()
+            self.file = self.raw = None
+
+def start_capture_writer():
+    global capture_writer
+    if CAPTURE_ENABLED and capture_writer is None:
+        capture_writer = CaptureWriter()
+        capture_writer.start()
+        atexit.register(capture_writer.stop)
+        log("info", f"Capture aktiv, Segmente in {CAPTURE_DIR}")
+
+PRESENCE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    discord_id INTEGER,
+    username TEXT NOT NULL,
+    region TEXT NOT NULL,
+    type TEXT NOT NULL,
+    started REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    ended REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_member ON sessions (discord_id, started);
+CREATE INDEX IF NOT EXISTS sessions_region ON sessions (region, started);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (region, username) WHERE ended IS NULL;
+-- Rollups for the slash commands: online seconds per member and day, online counts per region and hour (UTC)
+CREATE TABLE IF NOT EXISTS daily_presence (
+    day TEXT NOT NULL,
+    region TEXT NOT NULL,
+    username TEXT NOT NULL,
+    discord_id INTEGER,
+    type TEXT NOT NULL,
+    seconds REAL NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, region, username)
+);
+CREATE INDEX IF NOT EXISTS daily_presence_member ON daily_presence (discord_id, day);
+CREATE TABLE IF NOT EXISTS hourly_online (
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    region TEXT NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 0,
+    swat_sum INTEGER NOT NULL DEFAULT 0,
+    swat_peak INTEGER NOT NULL DEFAULT 0,
+    trainee_sum INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, hour, region)
+);
+"""
+
+def utc_day(ts):
+    return datetime.fromtimestamp(ts, pytz.UTC).strftime("%Y-%m-%d")
+
+def presence_connect():
+    db = sqlite3.connect(PRESENCE_DB_FILE, timeout=10)
+    # Only applies to a new file, so it has to come before journal_mode=WAL initialises it
+    db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+class PresenceWriter(threading.Thread):
+    """
+    Stores SWAT presence in PRESENCE_DB_FILE. The loop only queues events (see track_presence); this thread
+    writes them in one transaction per PRESENCE_FLUSH_INTERVAL and keeps the daily/hourly rollups current.
+    Sessions left open by a previous run are closed at their last_seen on start.
+    """
+    def __init__(self):
+        super().__init__(name="presence-writer", daemon=True)
+        self.events = queue.Queue()
+        self.db = None
+
+    def put(self, *event):
+        self.events.put_nowait(event)
+
+    def stop(self):
+        self.events.put(None)
+        self.join(timeout=10)
+
+    def run(self):
+        try:
+            self.db = presence_connect()
+            if self.db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # A file created without incremental auto_vacuum only switches with a full VACUUM
+                self.db.execute("VACUUM")
+            self.db.executescript(PRESENCE_SCHEMA)
+            with self.db:
+                for session_id, last_seen in self.db.execute(
+                        "SELECT id, last_seen FROM sessions WHERE ended IS NULL").fetchall():
+                    self.close_session(session_id, last_seen)
+        except sqlite3.Error as e:
+            logger.error(f"Präsenz-Datenbank konnte nicht geöffnet werden: {e}")
+            return
+
+        next_cleanup = 0
+        stopping = False
+        while not stopping:
+            batch = []
+            event = self.events.get()
+            deadline = time.monotonic() + PRESENCE_FLUSH_INTERVAL
+            while event is not None:
+                batch.append(event)
+                try:
+                    event = self.events.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
                     break
-            except Exception as ex:
-                log("error", f"Unexpected error in msg.send: {ex}")
+            stopping = event is None
+            try:
+                with metrics.timer("presence_write"):
+                    self.write(batch)
+                if time.time() >= next_cleanup:
+                    self.cleanup()
+                    next_cleanup = time.time() + 24 * 3600
+            except sqlite3.Error as e:
+                logger.warning(f"Präsenz-Daten konnten nicht geschrieben werden: {e}")
+        self.db.close()
+
+    def write(self, batch):
+        seen = {}
+        with self.db:
+            for event in batch:
+                kind = event[0]
+                if kind == "open":
+                    _, region, username, discord_id, player_type, started = event
+                    self.db.execute(
+                        "INSERT INTO sessions (discord_id, username, region, type, started, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                        (discord_id, username, region, player_type, started, started))
+                elif kind == "close":
+                    _, region, username, ended = event
+                    row = self.db.execute("SELECT id FROM sessions WHERE region = ? AND username = ? AND ended IS NULL",
+                                          (region, username)).fetchone()
+                    if row:
+                        self.close_session(row[0], ended)
+                elif kind == "seen":
+                    seen[event[1]] = event[2]
+                elif kind == "sample":
+                    _, region, ts, swat_count, trainee_count = event
+                    self.db.execute(
+                        "INSERT INTO hourly_online (day, hour, region, samples, swat_sum, swat_peak, trainee_sum) "
+                        "VALUES (?, ?, ?, 1, ?, ?, ?) ON CONFLICT (day, hour, region) DO UPDATE SET "
+                        "samples = samples + 1, swat_sum = swat_sum + excluded.swat_sum, "
+                        "swat_peak = MAX(swat_peak, excluded.swat_peak), trainee_sum = trainee_sum + excluded.trainee_sum",
+                        (utc_day(ts), datetime.fromtimestamp(ts, pytz.UTC).hour, region, swat_count, swat_count, trainee_count))
+            # Only the latest observation per region matters for the sessions that are still open
+            for region, ts in seen.items():
+                self.db.execute("UPDATE sessions SET last_seen = ? WHERE region = ? AND ended IS NULL", (ts, region))
+        metrics.inc("swat_presence_events_total", len(batch))
+
+    def close_session(self, session_id, ended):
+        discord_id, username, region, player_type, started = self.db.execute(
+            "SELECT discord_id, username, region, type, started FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        ended = max(ended, started)
+        self.db.execute("UPDATE sessions SET ended = ?, last_seen = ? WHERE id = ?", (ended, ended, session_id))
+        # Split the session at UTC midnight, so every day gets its own share
+        start, first = started, True
+        while True:
+            day = utc_day(start)
+            next_day = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=pytz.UTC).timestamp() + 24 * 3600
+            end = min(ended, next_day)
+            self.db.execute(
+                "INSERT INTO daily_presence (day, region, username, discord_id, type, seconds, sessions) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (day, region, username) DO UPDATE SET "
+                "seconds = seconds + excluded.seconds, sessions = sessions + excluded.sessions, "
+                "discord_id = excluded.discord_id, type = excluded.type",
+                (day, region, username, discord_id, player_type, end - start, 1 if first else 0))
+            if end >= ended:
                 break
+            start, first = end, False
+
+    def cleanup(self):
+        # Retention: raw sessions are only needed for a while, the rollups are kept much longer
+        now = time.time()
+        with self.db:
+            deleted = self.db.execute("DELETE FROM sessions WHERE ended IS NOT NULL AND ended < ?",
+                                      (now - PRESENCE_RETENTION_DAYS * 86400,)).rowcount
+            rollup_day = utc_day(now - PRESENCE_ROLLUP_RETENTION_DAYS * 86400)
+            deleted += self.db.execute("DELETE FROM daily_presence WHERE day < ?", (rollup_day,)).rowcount
+            deleted += self.db.execute("DELETE FROM hourly_online WHERE day < ?", (rollup_day,)).rowcount
+        if deleted:
+            self.db.execute("PRAGMA incremental_vacuum")
+            logger.info(f"Präsenz-Datenbank: {deleted} alte Einträge gelöscht.")
+
+def start_presence_writer():
+    global presence_writer
+    if PRESENCE_ENABLED and presence_writer is None:
+        presence_writer = PresenceWriter()
+        presence_writer.start()
+        atexit.register(presence_writer.stop)
+
+def track_presence(region, matching_players):
+    """
+    Turns the matched players of a region update into session open/close events for the PresenceWriter.
+    While a region has no data its sessions stay open, up to PRESENCE_SESSION_TIMEOUT.
+    """
+    if presence_writer is None:
+        return
+    now = time.time()
+    sessions = presence_sessions.setdefault(region, {})
+    if matching_players is None:
+        for username, session in list(sessions.items()):
+            if now - session["last_seen"] > PRESENCE_SESSION_TIMEOUT:
+                presence_writer.put("close", region, username, session["last_seen"])
+                del sessions[username]
+        return
+
+    online = {mp["username"]: mp for mp in matching_players}
+    for username in [u for u in sessions if u not in online]:
+        presence_writer.put("close", region, username, now)
+        del sessions[username]
+    for username, mp in online.items():
+        session = sessions.get(username)
+        if session is None:
+            sessions[username] = {"started": now, "last_seen": now}
+            presence_writer.put("open", region, username, mp["discord_id"], mp["type"], now)
+        else:
+            session["last_seen"] = now
+    swat_count = sum(1 for mp in matching_players if mp["type"] in ("SWAT", "mentor", "unknown"))
+    presence_writer.put("seen", region, now)
+    presence_writer.put("sample", region, now, swat_count, len(matching_players) - swat_count)
+    metrics.set("swat_presence_open_sessions", len(sessions), region=region)
+
+def player_key(username):
+    # "[SWAT] Name" and "⭐ Name" are found as "name"
+    return SWAT_PREFIX_RE.sub('', username.removeprefix(f"{LEADERSHIP_EMOJI} ")).casefold()
+
+def update_player_index(region, matching_players):
+    """
+    Replaces the region's players in the cross-region index. The new index is built completely and then
+    swapped in with one assignment, so lookups never see a half-built state.
+    """
+    global player_index
+    now = time.time()
+    previous = {e["username"]: e for e in player_index["regions"].get(region, ())}
+    regions = dict(player_index["regions"])
+    if matching_players is None:
+        regions.pop(region, None)
+    else:
+        regions[region] = [
+            {
+                "username": mp["username"],
+                "discord_id": mp["discord_id"],
+                "region": region,
+                "type": mp["type"],
+                "rank": mp["rank"],
+                "first_seen": previous[mp["username"]]["first_seen"] if mp["username"] in previous else now,
+            }
+            for mp in matching_players
+        ]
+    by_name, by_id = {}, {}
+    for entries in regions.values():
+        for entry in entries:
+            by_name.setdefault(player_key(entry["username"]), []).append(entry)
+            if entry["discord_id"]:
+                by_id.setdefault(entry["discord_id"], []).append(entry)
+    player_index = {"regions": regions, "by_name": by_name, "by_id": by_id, "updated_at": now}
+
+def find_players(query):
+    # Exact name or Discord id first, otherwise all names containing the query
+    index = player_index
+    mention = re.fullmatch(r"<@!?(\d+)>|(\d{15,20})", query.strip())
+    if mention:
+        return index["by_id"].get(int(mention.group(1) or mention.group(2)), [])
+    key = player_key(query.strip())
+    if key in index["by_name"]:
+        return index["by_name"][key]
+    return [e for name, entries in index["by_name"].items() if key in name for e in entries]
+
+def presence_query(sql, params=()):
+    # Runs in a worker thread with its own connection; WAL lets it read while the writer writes
+    db = presence_connect()
+    try:
+        return db.execute(sql, params).fetchall()
+    finally:
+        db.close()
+
+async def monitor_loop_lag(interval=0.5):
+    # Measures how late the event loop wakes up from a sleep
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        metrics.observe("swat_event_loop_lag_seconds", lag)
+        metrics.set("swat_event_loop_lag_last_seconds", lag)
 
-# --- Bot Token Loader ---
-file_name = TOKEN_FILE
-with open(file_name, "r") as file:
-    TOKEN = file.read().strip()
+async def handle_metrics(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
 
-try:
-    client.run(TOKEN)
-except Exception as e:
-    log("critical", f"Bot Fehler: {e}")
-    sys.exit(1)
+async def start_metrics_server():
+    global metrics_runner
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    # Scrapes would fill the log file, which also receives the library records
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    log("info", f"Metriken unter http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+async def stop_metrics_server():
+    global metrics_runner
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+        metrics_runner = None
+
+@client.tree.command(name="metrics", description="Zeigt Laufzeiten und Zähler der Playerlist")
+async def metrics_command(interaction: discord.Interaction):
+    lines = [f"{'Stage':<34}{'n':>6}{'avg ms':>9}{'p95 ms':>9}"]
+    for stage, (count, avg, p95) in sorted(metrics.stage_summary().items()):
+        p95_text = ">10s" if p95 == float("inf") else f"{p95 * 1000:.0f}"
+        lines.append(f"{stage:<34}{count:>6}{avg * 1000:>9.1f}{p95_text:>9}")
+    lines.append("")
+    for region in API_URLS:
+        hits = metrics.counter_value("swat_snapshot_cache_total", region=region, result="hit")
+        misses = metrics.counter_value("swat_snapshot_cache_total", region=region, result="miss")
+        errors = sum(
+            value for (name, labels), value in metrics.counters.items()
+            if name == "swat_fetch_errors_total" and ("region", region) in labels
+        )
+        rate = hits / (hits + misses) * 100 if hits + misses else 0
+        lines.append(f"{region:<6} Cache {rate:5.1f}%  Fehler {errors}")
+    lines.append("")
+    for kind in ("swat", "tag"):
+        counts = {m: metrics.counter_value("swat_match_total", kind=kind, method=m) for m in ("exact", "alias", "fuzzy", "none")}
+        total = sum(counts.values())
+        # Untagged players are mostly not members, so only [SWAT] names have a meaningful hit rate
+        rate = f"{(total - counts['none']) / total * 100 if total else 0:5.1f}%" if kind == "swat" else " " * 6
+        lines.append(f"Treffer {kind:<5}{rate}  " + "  ".join(f"{m} {c:.0f}" for m, c in counts.items()))
+    lag = metrics.gauge_value("swat_event_loop_lag_last_seconds")
+    lines.append(f"\nEvent-Loop-Lag: {lag * 1000:.1f} ms")
+    await interaction.response.send_message("```" + "\n".join(lines) + "```", ephemeral=True)
+
+def describe_player(entry):
+    rank = entry["rank"] or entry["type"]
+    mention = f" (<@{entry['discord_id']}>)" if entry["discord_id"] else ""
+    return f"**{entry['username']}**{mention} - {entry['region']}, {rank}, online since <t:{int(entry['first_seen'])}:R>"
+
+@client.tree.command(name="whereis", description="Shows the region a SWAT member or trainee is playing on")
+@app_commands.describe(name="In-game name (or part of it)", member="Discord member")
+async def whereis_command(interaction: discord.Interaction, name: str = None, member: discord.Member = None):
+    if member is None and not name:
+        await interaction.response.send_message("Please give a name or a member.", ephemeral=True)
+        return
+    with metrics.timer("player_lookup"):
+        found = player_index["by_id"].get(member.id, []) if member else find_players(name)
+    if not found:
+        await interaction.response.send_message(f"{member.mention if member else name} is not online.", ephemeral=True,
+                                                allowed_mentions=discord.AllowedMentions.none())
+        return
+    lines = [describe_player(entry) for entry in found[:15]]
+    if len(found) > 15:
+        lines.append(f"*... and {len(found) - 15} more*")
+    await interaction.response.send_message("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+@client.tree.command(name="online", description="SWAT members online, optionally by rank or region")
+@app_commands.describe(rank="Only this rank", region="Only this region")
+@app_commands.choices(rank=[app_commands.Choice(name=rank, value=rank) for rank in RANK_HIERARCHY if rank])
+async def online_command(interaction: discord.Interaction, rank: str = None, region: str = None):
+    with metrics.timer("player_lookup"):
+        index = player_index
+        found = [
+            entry
+            for entry_region, entries in index["regions"].items() if not region or entry_region == region.upper()
+            for entry in entries if not rank or entry["rank"] == rank
+        ]
+    if not found:
+        await interaction.response.send_message("Nobody matching is online.", ephemeral=True)
+        return
+    lines = [describe_player(entry) for entry in found[:25]]
+    if len(found) > 25:
+        lines.append(f"*... and {len(found) - 25} more*")
+    await interaction.response.send_message("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+PRESENCE_TYPES = {"swat": ("SWAT", "mentor", "unknown"), "trainee": ("trainee", "cadet")}
+# Closed sessions are in the daily rollup, sessions still open count up to their last observation
+PRESENCE_TOTALS = (
+    "WITH presence AS ("
+    "SELECT day, region, username, discord_id, type, seconds, sessions FROM daily_presence UNION ALL "
+    "SELECT date(started, 'unixepoch'), region, username, discord_id, type, last_seen - started, 1 "
+    "FROM sessions WHERE ended IS NULL) "
+)
+
+def presence_since(days):
+    return utc_day(time.time() - days * 86400)
+
+def presence_name(discord_id, username):
+    return f"<@{discord_id}>" if discord_id else username
+
+async def presence_unavailable(interaction):
+    if presence_writer is None:
+        await interaction.response.send_message("Presence history is disabled.", ephemeral=True)
+        return True
+    return False
+
+@client.tree.command(name="leaderboard", description="Most SWAT hours online")
+@app_commands.describe(days="Time span in days", region="Only this region", group="SWAT or cadets/trainees")
+@app_commands.choices(group=[app_commands.Choice(name="SWAT", value="swat"),
+                             app_commands.Choice(name="Cadets / Trainees", value="trainee")])
+async def leaderboard_command(interaction: discord.Interaction, days: app_commands.Range[int, 1, 365] = 7,
+                              region: str = None, group: str = "swat"):
+    if await presence_unavailable(interaction):
+        return
+    types = PRESENCE_TYPES[group]
+    sql = (f"{PRESENCE_TOTALS}SELECT discord_id, username, SUM(seconds) AS total, SUM(sessions) FROM presence "
+           f"WHERE day >= ? AND type IN ({','.join('?' * len(types))})")
+    params = [presence_since(days), *types]
+    if region:
+        sql += " AND region = ?"
+        params.append(region.upper())
+    sql += " GROUP BY COALESCE(discord_id, username) ORDER BY total DESC LIMIT 15"
+    rows = await asyncio.to_thread(presence_query, sql, params)
+    if not rows:
+        await interaction.response.send_message("No presence data for this time span.", ephemeral=True)
+        return
+    lines = [f"**{i}.** {presence_name(discord_id, username)} - {total / 3600:.1f} h ({sessions} sessions)"
+             for i, (discord_id, username, total, sessions) in enumerate(rows, start=1)]
+    embed = discord.Embed(title=f"Leaderboard - last {days} days{f' ({region.upper()})' if region else ''}",
+                          description="\n".join(lines), colour=0x28ef05)
+    await interaction.response.send_message(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
+@client.tree.command(name="stats", description="Online time of a member")
+@app_commands.describe(member="Discord member", days="Time span in days")
+async def stats_command(interaction: discord.Interaction, member: discord.Member,
+                        days: app_commands.Range[int, 1, 365] = 30):
+    if await presence_unavailable(interaction):
+        return
+    rows = await asyncio.to_thread(
+        presence_query,
+        PRESENCE_TOTALS + "SELECT region, SUM(seconds), SUM(sessions), MAX(day) FROM presence "
+        "WHERE discord_id = ? AND day >= ? GROUP BY region ORDER BY SUM(seconds) DESC",
+        (member.id, presence_since(days)))
+    if not rows:
+        await interaction.response.send_message(f"{member.mention} was not online in the last {days} days.",
+                                                ephemeral=True, allowed_mentions=discord.AllowedMentions.none())
+        return
+    total = sum(r[1] for r in rows)
+    embed = discord.Embed(title=f"{member.display_name} - last {days} days", colour=0x28ef05)
+    embed.add_field(name="Online", value=f"```{total / 3600:.1f} h```", inline=True)
+    embed.add_field(name="Sessions", value=f"```{sum(r[2] for r in rows)}```", inline=True)
+    embed.add_field(name="Last day online", value=f"```{max(r[3] for r in rows)}```", inline=True)
+    embed.add_field(name="Regions", value="\n".join(f"{r[0]}: {r[1] / 3600:.1f} h" for r in rows), inline=False)
+    await interaction.response.send_message(embed=embed)
+
+@client.tree.command(name="peaktimes", description="Hours with the most SWAT online")
+@app_commands.describe(region="Only this region", days="Time span in days")
+async def peaktimes_command(interaction: discord.Interaction, region: str = None,
+                            days: app_commands.Range[int, 1, 365] = 28):
+    if await presence_unavailable(interaction):
+        return
+    sql = ("SELECT CAST(strftime('%w', day) AS INTEGER) AS weekday, hour, "
+           "SUM(swat_sum) * 1.0 / SUM(samples) AS average, MAX(swat_peak) FROM hourly_online WHERE day >= ?")
+    params = [presence_since(days)]
+    if region:
+        sql += " AND region = ?"
+        params.append(region.upper())
+    sql += " GROUP BY weekday, hour ORDER BY average DESC LIMIT 10"
+    rows = await asyncio.to_thread(presence_query, sql, params)
+    if not rows:
+        await interaction.response.send_message("No presence data for this time span.", ephemeral=True)
+        return
+    weekdays = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+    lines = [f"{weekdays[weekday]:<10} {hour:02d}:00 UTC  avg {average:4.1f}  peak {peak}"
+             for weekday, hour, average, peak in rows]
+    await interaction.response.send_message(
+        f"**Peak times - last {days} days{f' ({region.upper()})' if region else ''}**\n```" + "\n".join(lines) + "```")
+
+if __name__ == "__main__":
+    # --- Bot Token Loader ---
+    file_name = TOKEN_FILE
+    with open(file_name, "r") as file:
+        TOKEN = file.read().strip()
+
+    try:
+        client.run(TOKEN)
+    except Exception as e:
+        log("critical", f"Bot Fehler: {e}")
+        sys.exit(1)
+    sys.exit(supervisor.exit_code)
@@ -0,0 +1,189 @@
+# replay.py
+# Replays captured API responses and member changes (CAPTURE_ENABLED in config.py) through update_game_status
+# at full speed, with the network and Discord stubbed out. The capture time is the bot's clock, so the output
+# does not depend on when the replay runs. Writes the rendered output of every cycle, so two runs can be
+# diffed, and optionally profiles the pipeline.
+#
+# Usage: python replay.py captures/ --output run.jsonl [--diff previous.jsonl] [--profile replay.prof]
+import argparse, asyncio, cProfile, difflib, glob, gzip, json, logging, os, pstats, sys, tempfile, time, zlib
+from collections import deque
+from datetime import datetime
+
+from benchmark import FakeChannel, percentile, stage_totals
+import main
+
+
+def read_segments(paths):
+    """
+    Reads all records of the given segments (or directories of segments) in time order. A segment that was
+    still being written when the bot stopped ends in a truncated gzip stream; its complete lines are kept.
+    """
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, "capture-*.jsonl.gz"))) if os.path.isdir(path) else [path]
+    records = []
+    for file_name in files:
+        try:
+            with gzip.open(file_name, "rt", encoding="utf-8") as file:
+                for line in file:
+                    if line.endswith("\n"):
+                        records.append(json.loads(line))
+        except (EOFError, zlib.error) as e:
+            print(f"{file_name}: truncated ({e}), using the complete records", file=sys.stderr)
+    records.sort(key=lambda r: r["t"])
+    return files, records
+
+
+class ReplayHttp:
+    """
+    Replaces main.http_get. Every endpoint serves its recorded responses in order and repeats the last one
+    when it runs out. A recorded 304 is answered with the last body, validators are never sent back.
+    """
+    def __init__(self, records):
+        self.responses = {}
+        self.last = {}
+        self.served = 0
+        for record in records:
+            if record["type"] == "http":
+                self.responses.setdefault(record["key"], deque()).append(record)
+
+    def next_time(self, prefix):
+        # Capture time of the next unserved response of any endpoint with this key prefix
+        times = [q[0]["t"] for key, q in self.responses.items() if key.startswith(prefix) and q]
+        return min(times) if times else None
+
+    def remaining(self, prefix):
+        return max((len(q) for key, q in self.responses.items() if key.startswith(prefix)), default=0)
+
+    async def __call__(self, url, key, headers, **kwargs):
+        self.served += 1
+        queue = self.responses.get(key)
+        record = queue.popleft() if queue else self.last.get(key)
+        if record is None:
+            return 404, b"", {}
+        if record["status"] == 304:
+            record = self.last.get(key, record)
+        if record["status"] < 400:
+            self.last[key] = record
+        return record["status"], record["body"].encode("utf-8", "surrogateescape"), {}
+
+
+def apply_member_records(records, until):
+    # Applies member snapshots and changes captured up to the time of the next cycle
+    while records and records[0]["t"] <= until:
+        record = records.popleft()
+        if record["type"] == "members":
+            main.restore_member_cache(record["members"], datetime.fromtimestamp(record["t"]))
+        elif record["type"] == "member":
+            main.cache_put_member(record["id"], record["name"], record["roles"])
+        elif record["type"] == "member_remove":
+            main.cache_remove_member(record["id"])
+
+
+def cycle_output(cycle):
+    # The rendered result of every region, without the render timestamp
+    output = []
+    for region in main.API_URLS:
+        state = main.region_state.get(region, {})
+        embed = state["embed"].to_dict() if "embed" in state else None
+        if embed:
+            embed.pop("timestamp", None)
+        output.append({"cycle": cycle, "region": region, "players": state.get("matching_players"), "embed": embed})
+    return output
+
+
+def diff_outputs(previous_file, outputs):
+    with open(previous_file, "r", encoding="utf-8") as file:
+        previous = {(o["cycle"], o["region"]): o for o in map(json.loads, file)}
+    current = {(o["cycle"], o["region"]): o for o in outputs}
+    differing = [key for key in sorted(previous.keys() | current.keys()) if previous.get(key) != current.get(key)]
+    print(f"Diff against {previous_file}: {len(differing)} of {len(current)} region renders differ")
+    for key in differing[:5]:
+        before = json.dumps(previous.get(key), indent=1, sort_keys=True).splitlines()
+        after = json.dumps(current.get(key), indent=1, sort_keys=True).splitlines()
+        print(f"\n--- cycle {key[0]}, {key[1]}")
+        print("\n".join(list(difflib.unified_diff(before, after, lineterm="", n=1))[2:40]))
+    return len(differing)
+
+
+async def run(args):
+    files, records = read_segments(args.segments)
+    if not records:
+        print("No records found.")
+        return 1
+    http = ReplayHttp(records)
+    member_records = deque(r for r in records if r["type"] in ("members", "member", "member_remove"))
+    cycles = args.cycles or http.remaining("players:")
+    print(f"{len(files)} segments, {len(records)} records, "
+          f"{datetime.fromtimestamp(records[0]['t']):%d.%m.%Y %H:%M:%S} - {datetime.fromtimestamp(records[-1]['t']):%d.%m.%Y %H:%M:%S}, "
+          f"{cycles} cycles")
+
+    # Network and Discord stubbed out; every cycle fetches every endpoint and no endpoint is ever skipped
+    channel = FakeChannel(main.STATUS_CHANNEL_ID)
+    main.http_get = http
+    main.client.get_channel = lambda channel_id: channel if channel_id == channel.id else None
+    main.client.get_partial_messageable = lambda channel_id: channel
+    main.STATUS_TARGETS = [channel.id]
+    main.client.get_emoji = lambda emoji_id: None
+    main.EMBEDS_FILE = os.path.join(tempfile.mkdtemp(prefix="swat-replay-"), "embeds.json")
+    main.QUEUE_DATA_MAX_AGE = 0
+    main.CIRCUIT_FAILURE_THRESHOLD = float("inf")
+    if not args.verbose:
+        main.log_console_handler.setLevel(logging.CRITICAL + 1)
+
+    profiler = cProfile.Profile() if args.profile else None
+    outputs, latencies, stage_before = [], [], stage_totals()
+    # The bot judges the data by the time it was captured (heartbeats, stale markers), not the wall clock
+    cycle_time = records[0]["t"]
+    main.clock = lambda: cycle_time
+    for cycle in range(cycles):
+        next_time = http.next_time("players:")
+        cycle_time = next_time or cycle_time
+        apply_member_records(member_records, next_time or float("inf"))
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        await main.update_game_status()
+        latencies.append(time.perf_counter() - start)
+        if profiler:
+            profiler.disable()
+        outputs += cycle_output(cycle)
+    stage_after = stage_totals()
+
+    print(f"  cycle latency  p50 {percentile(latencies, 50) * 1000:8.1f} ms   "
+          f"p95 {percentile(latencies, 95) * 1000:8.1f} ms   max {max(latencies) * 1000:8.1f} ms")
+    print(f"  {'stage':<36}{'calls':>7}{'total ms':>11}")
+    for stage, (count, total) in sorted(stage_after.items()):
+        count -= stage_before.get(stage, (0, 0.0))[0]
+        total -= stage_before.get(stage, (0, 0.0))[1]
+        if count:
+            print(f"  {stage:<36}{count:>7}{total * 1000:>11.1f}")
+    print(f"  responses served: {http.served}, REST calls: {dict(channel.rest_calls)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            for output in outputs:
+                file.write(json.dumps(output, sort_keys=True) + "\n")
+        print(f"Output written to {args.output}")
+    if profiler:
+        profiler.dump_stats(args.profile)
+        print(f"\nProfile written to {args.profile}, top functions by cumulative time:")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    if args.diff:
+        return 1 if diff_outputs(args.diff, outputs) else 0
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured API traffic through the update pipeline")
+    parser.add_argument("segments", nargs="+", help="capture segments or directories containing them")
+    parser.add_argument("--cycles", type=int, help="number of cycles (default: number of captured player responses)")
+    parser.add_argument("--output", help="write the rendered output of every cycle as JSONL")
+    parser.add_argument("--diff", metavar="FILE", help="compare the output with an earlier --output file")
+    parser.add_argument("--profile", metavar="FILE", help="profile the cycles with cProfile")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))